@@ -0,0 +1,212 @@
+"""
+Query-plan check: the hot paths must stay on an index
+
+    python benchmarks/query_plans.py [-v]
+
+Uses DATABASE_URL when set (point it at a scratch PostgreSQL database) and a
+throwaway SQLite file otherwise. The schema is built by running the
+migrations, so a migration that drops an index is caught as well as a model
+change. Seeds a dataset inside one outer transaction, sends a request to
+each route through the test client while recording the SQL it emits (the
+routes' commits only release a savepoint), EXPLAINs every statement and
+rolls everything back. Exits non-zero when any plan falls back to a full
+table scan (SQLite ``SCAN <table>``, PostgreSQL ``Seq Scan``) or a route
+does not answer as expected; ``-v`` prints every plan, not only the
+failing ones.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+DB_PATH = None
+if 'DATABASE_URL' not in os.environ:
+    DB_PATH = os.path.join(tempfile.mkdtemp(), 'plans.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('ACCESS_LOG_ENABLED', '0')
+
+from flask_migrate import upgrade  # noqa: E402
+from sqlalchemy import event, insert, select, update  # noqa: E402
+from app import app  # noqa: E402
+# La identidad del token es el id entero del usuario; PyJWT >= 2.10 exige un 'sub' de texto
+app.config['JWT_VERIFY_SUB'] = False
+from models import db, User, Favourite, Popularity, Person, CATALOG_MODELS  # noqa: E402
+import relations  # noqa: E402
+from validation import validator_for  # noqa: E402
+
+ROWS = 500
+# Rutas que deben fallar: el INSERT ... ON CONFLICT DO NOTHING detecta el favorito repetido
+EXPECTED_STATUS = {'duplicate favourite': 400}
+
+
+def blank(model, **values):
+    """Row with every required column of ``model`` empty (0 or ''), overridden by ``values``."""
+    row = {column.name: 0 if column.type.python_type is int else ''
+           for column in model.__table__.columns if column.name in validator_for(model).required}
+    return {**row, **values}
+
+# Ruta de cada tipo: lectura por id y borrado de una fila (los vehículos se leen en /vehicles)
+READ_ROUTES = {'user': '/user', 'person': '/person', 'planet': '/planet', 'film': '/film',
+               'starship': '/starship', 'vehicle': '/vehicles'}
+DELETE_ROUTES = {'person': '/person', 'planet': '/planet', 'film': '/film',
+                 'starship': '/starship', 'vehicle': '/vehicle'}
+
+
+def seed():
+    """{entity type: ids} of a dataset with favourites, residents and film links on every row."""
+    db.session.execute(insert(User), [{"name": f'plan-user{i}', "password": 'secret'} for i in range(ROWS)])
+    for entity_type, model in CATALOG_MODELS.items():
+        key = 'title' if entity_type == 'film' else 'name'
+        db.session.execute(insert(model), [blank(model, **{key: f'plan-{entity_type}{i}'}) for i in range(ROWS)])
+    ids = {'user': db.session.scalars(select(User.id_user).order_by(User.id_user)).all()}
+    ids.update({entity_type: db.session.scalars(select(model.id).order_by(model.id)).all()
+                for entity_type, model in CATALOG_MODELS.items()})
+
+    db.session.execute(update(Person), [{"id": id_, "homeworld_id": ids['planet'][i]}
+                                        for i, id_ in enumerate(ids['person'])])
+    for target, table in relations.FILM_LINKS.items():
+        db.session.execute(insert(table), [{"film_id": ids['film'][i], f'{target}_id': ids[target][(i * 7 + k) % ROWS]}
+                                           for i in range(ROWS) for k in range(3)])
+    favourites = [{"id_user": id_user, "entity_type": entity_type, "entity_id": ids[entity_type][(i * 7) % ROWS]}
+                  for i, id_user in enumerate(ids['user']) for entity_type in CATALOG_MODELS]
+    db.session.execute(insert(Favourite), favourites)
+    db.session.execute(insert(Popularity), [{"entity_type": row["entity_type"], "entity_id": row["entity_id"],
+                                             "favourite_count": 1} for row in favourites])
+    return ids
+
+
+def hot_paths(ids):
+    """(label, callable) for every route whose SQL has to use an index, run through the test client."""
+    client = app.test_client()
+    name = f'plan-user{ROWS // 2}'
+    id_user = ids['user'][ROWS // 2]
+    token = {}
+
+    def login():
+        response = client.post('/login', json={"name": name, "password": 'secret'})
+        token['value'] = response.json['access_token']
+        return response
+
+    paths = [
+        ('login', login),
+        ('favourites by user', lambda: client.get(f'/user/{id_user}/favourites',
+                                                  headers={"Authorization": f"Bearer {token['value']}"})),
+    ]
+
+    def id_list(values):
+        return ','.join(map(str, values))
+
+    # Las lecturas usan las primeras filas y los borrados, que van después, las últimas
+    for entity_type, route in READ_ROUTES.items():
+        paths.append((f'{entity_type} by id', lambda route=route, id_=ids[entity_type][0]: client.get(f'{route}/{id_}')))
+        paths.append((f'{entity_type} by ids',
+                      lambda route=route, values=ids[entity_type][:3]: client.get(f'{route}?ids={id_list(values)}')))
+
+    for entity_type, named in relations.RELATIONS.items():
+        for relation in named:
+            paths.append((f'expand {entity_type}.{relation}',
+                          lambda route=READ_ROUTES[entity_type], relation=relation, values=ids[entity_type][:3]:
+                          client.get(f'{route}?ids={id_list(values)}&expand={relation}')))
+
+    # El usuario i ya tiene como favorita la persona (i * 7) % ROWS del seed
+    paths.append(('add favourite', lambda id_user=ids['user'][1]: client.post(
+        '/favourite', json={"id_user": id_user, "favourite_person": ids['person'][ROWS - 2]})))
+    paths.append(('duplicate favourite', lambda id_user=ids['user'][1]: client.post(
+        '/favourite', json={"id_user": id_user, "favourite_person": ids['person'][7]})))
+
+    paths.append(('delete user', lambda id_=ids['user'][-1]: client.delete(f'/user/{id_}')))
+    for entity_type, route in DELETE_ROUTES.items():
+        paths.append((f'delete {entity_type}', lambda route=route, id_=ids[entity_type][-1]: client.delete(f'{route}/{id_}')))
+        paths.append((f'bulk delete {entity_type}',
+                      lambda route=READ_ROUTES[entity_type], values=ids[entity_type][-4:-1]:
+                      client.delete(f'{route}?ids={id_list(values)}')))
+    return paths
+
+
+def capture(connection, run):
+    emitted = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE')):
+            # El ORM borra las filas de las tablas de enlace con executemany: basta con el primer juego
+            emitted.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(connection, 'before_cursor_execute', record)
+    try:
+        response = run()
+    finally:
+        event.remove(connection, 'before_cursor_execute', record)
+    return response, emitted
+
+
+def explain(connection, statement, parameters):
+    """(plan lines, full scans) for one statement."""
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        lines = [row[-1] for row in rows]
+        # SEARCH usa un índice; SCAN recorre la tabla (o el índice) entero
+        scans = [line for line in lines if line.startswith('SCAN ') and line != 'SCAN CONSTANT ROW']
+        return lines, scans
+
+    # Sin seq scan permitido, el planificador solo lo elige si no hay ningún índice utilizable
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    lines, scans = [], []
+
+    def walk(node, depth):
+        line = '  ' * depth + node['Node Type'] + (f" on {node['Relation Name']}" if 'Relation Name' in node else '')
+        lines.append(line)
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(line.strip())
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines, scans
+
+
+def main():
+    verbose = '-v' in sys.argv[1:]
+    failures = 0
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        engines = db.engines
+        engine = engines[None]
+        connection = engine.connect()
+        transaction = connection.begin()
+        # Las peticiones comparten este contexto de aplicación, así que usan la misma sesión;
+        # ligada a la conexión abierta, cada commit de una ruta es solo un savepoint
+        engines[None] = connection
+        db.session.remove()
+        db.session.configure(join_transaction_mode='create_savepoint')
+        try:
+            ids = seed()
+            db.session.commit()
+            for label, run in hot_paths(ids):
+                response, emitted = capture(connection, run)
+                expected = EXPECTED_STATUS.get(label)
+                if response.status_code != expected if expected else response.status_code >= 400:
+                    failures += 1
+                    print(f'{"FAILED":9} {label}: {response.status_code} {response.get_data(as_text=True)[:100]}')
+                for statement, parameters in emitted:
+                    lines, scans = explain(connection, statement, parameters)
+                    status = 'FULL SCAN' if scans else 'ok'
+                    failures += bool(scans)
+                    print(f'{status:9} {label}: {" ".join(statement.split())[:100]}')
+                    if scans or verbose:
+                        for line in lines:
+                            print(f'          | {line}')
+        finally:
+            db.session.remove()
+            engines[None] = engine
+            transaction.rollback()
+            connection.close()
+    if DB_PATH:
+        os.remove(DB_PATH)
+    print(f'{failures} failure(s)')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Mixed read/write throughput on SQLite across worker processes
+
+    python benchmarks/sqlite_mixed.py [workers] [threads] [seconds] [write_ratio]
+
+Runs the same workload twice on a fresh database file, with SQLITE_TUNED off
+and on. Every worker is a separate process with its own engine, like gunicorn
+workers, and runs ``threads`` concurrent clients, like gunicorn ``--threads``,
+so the per-process writer lock is contended as well as the file lock. Reads
+fetch a person by id, log in or POST a /batch lookup; writes alternate between
+PATCHing a person and adding or removing a favourite.
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PEOPLE = 200
+USERS = 256
+
+
+def configure(db_path, tuned):
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SQLITE_TUNED'] = '1' if tuned else '0'
+    os.environ['ACCESS_LOG_ENABLED'] = '0'
+    os.environ['ADMISSION_ENABLED'] = '0'
+    # Sin caché de respuestas: se mide la base de datos
+    os.environ['RESPONSE_CACHE_TTL'] = '0'
+
+
+def seed(db_path, tuned):
+    configure(db_path, tuned)
+    from app import app
+    from models import db, User, Person
+    from validation import validator_for
+    # Columnas obligatorias vacías: solo importa el nombre
+    blank = {column.name: 0 if column.type.python_type is int else ''
+             for column in Person.__table__.columns if column.name in validator_for(Person).required}
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Person(**{**blank, "name": f'person{i}'}) for i in range(PEOPLE)])
+        db.session.add_all([User(name=f'bench{i}', password='x') for i in range(USERS)])
+        db.session.commit()
+
+
+def client_loop(app, id_user, seed_value, seconds, write_ratio, totals, lock):
+    client = app.test_client()
+    rng = random.Random(seed_value)
+    reads = writes = errors = 0
+    favourites = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if rng.random() >= write_ratio:
+            # Lecturas, también las que llegan por POST: no deben esperar al escritor
+            choice = rng.random()
+            if choice < 0.6:
+                status = client.get(f'/person/{rng.randint(1, PEOPLE)}').status_code
+            elif choice < 0.8:
+                status = client.post('/login', json={"name": f'bench{id_user - 1}', "password": 'x'}).status_code
+            else:
+                status = client.post('/batch', json=[{"resource": 'person', "id": rng.randint(1, PEOPLE)}
+                                                     for _ in range(5)]).status_code
+            reads += 1
+        elif rng.random() < 0.5:
+            status = client.patch(f'/person/{rng.randint(1, PEOPLE)}', json={"mass": rng.randint(1, 200)}).status_code
+            writes += 1
+        elif favourites and rng.random() < 0.5:
+            status = client.delete(f'/user/{id_user}/favourites/{favourites.pop()}').status_code
+            writes += 1
+        else:
+            response = client.post('/favourite', json={"id_user": id_user, "favourite_person": rng.randint(1, PEOPLE)})
+            status = response.status_code
+            if status == 201:
+                favourites.append(response.json["id_favourite"])
+            elif status == 400:
+                # Favorito repetido: no es un error de la base de datos
+                status = 200
+            writes += 1
+        if status >= 500:
+            errors += 1
+    with lock:
+        totals.append((reads, writes, errors))
+
+
+def worker(db_path, tuned, worker_id, threads, seconds, write_ratio, results):
+    configure(db_path, tuned)
+    from app import app
+    # Varios clientes por proceso, como un worker gunicorn con --threads: se disputan _write_lock
+    totals, lock = [], threading.Lock()
+    clients = [threading.Thread(target=client_loop,
+                                args=(app, worker_id * threads + i + 1, worker_id * 1000 + i,
+                                      seconds, write_ratio, totals, lock))
+               for i in range(threads)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    results.put(tuple(sum(column) for column in zip(*totals)))
+
+
+def run(tuned, workers, threads, seconds, write_ratio):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    ctx = multiprocessing.get_context('spawn')
+    process = ctx.Process(target=seed, args=(db_path, tuned))
+    process.start()
+    process.join()
+
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(db_path, tuned, i, threads, seconds, write_ratio, results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    reads, writes, errors = (sum(column) for column in zip(*totals))
+    label = 'tuned  ' if tuned else 'default'
+    print(f'{label} reads/s {reads / seconds:8.1f}  writes/s {writes / seconds:8.1f}  errors {errors}')
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    write_ratio = float(sys.argv[4]) if len(sys.argv) > 4 else 0.2
+    if workers * threads > USERS:
+        sys.exit(f'At most {USERS} clients (workers x threads)')
+    print(f'{workers} workers x {threads} threads, {seconds:g}s, {write_ratio:.0%} writes')
+    run(False, workers, threads, seconds, write_ratio)
+    run(True, workers, threads, seconds, write_ratio)
+
+
+if __name__ == '__main__':
+    main()
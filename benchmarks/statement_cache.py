@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: hot-path lookups built per call vs the prebuilt statements
+
+    python benchmarks/statement_cache.py [iterations]
+
+Runs against a throwaway SQLite database, so the numbers are dominated by the
+Python side (query construction and compilation), which is what changes.
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('ACCESS_LOG_ENABLED', '0')
+
+from app import app  # noqa: E402
+from models import db, User, Favourite, Person  # noqa: E402
+import statements  # noqa: E402
+from validation import validator_for  # noqa: E402
+
+
+def blank(model, **values):
+    """Row with every required column of ``model`` empty (0 or ''), overridden by ``values``."""
+    row = {column.name: 0 if column.type.python_type is int else ''
+           for column in model.__table__.columns if column.name in validator_for(model).required}
+    return {**row, **values}
+
+
+def seed():
+    db.create_all()
+    users = [User(name=f'user{i}', password='secret') for i in range(200)]
+    people = [Person(**blank(Person, name=f'person{i}')) for i in range(200)]
+    db.session.add_all(users + people)
+    db.session.flush()
+    db.session.add_all(Favourite(id_user=user.id_user, entity_type='person', entity_id=people[i].id)
+                       for i, user in enumerate(users))
+    db.session.commit()
+
+
+CASES = {
+    'login': (
+        lambda: User.query.filter_by(name='user42', password='secret').first(),
+        lambda: statements.first(statements.USER_BY_CREDENTIALS, name='user42', password='secret'),
+    ),
+    'pk fetch': (
+        lambda: Person.query.filter_by(id=42).first(),
+        lambda: statements.by_id('person', 42),
+    ),
+    'user favourites': (
+        lambda: Favourite.query.filter_by(id_user=42).order_by(Favourite.id_favourite).all(),
+        lambda: statements.all_rows(statements.USER_FAVOURITES, id_user=42),
+    ),
+}
+
+
+def measure(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+        # Sin identity map entre iteraciones, como en peticiones distintas
+        db.session.expunge_all()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with app.app_context():
+        seed()
+        print(f'{"path":<28}{"built per call":>16}{"prebuilt":>12}{"saved":>10}')
+        for name, (built, prebuilt) in CASES.items():
+            before = measure(built, iterations)
+            after = measure(prebuilt, iterations)
+            print(f'{name:<28}{before:>13.1f} us{after:>9.1f} us{(1 - after / before) * 100:>9.1f}%')
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Concurrency check: many threads upsert and create the same name at once
+
+    python benchmarks/upsert_concurrency.py [threads]
+
+Uses DATABASE_URL when set (point it at a PostgreSQL database to check the
+real deployment) and a throwaway SQLite file otherwise. Exits non-zero unless
+exactly one row exists and exactly one request reported it as created.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+DB_PATH = None
+if 'DATABASE_URL' not in os.environ:
+    DB_PATH = os.path.join(tempfile.mkdtemp(), 'upsert.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('ACCESS_LOG_ENABLED', '0')
+
+from app import app  # noqa: E402
+from models import db, Planet  # noqa: E402
+
+NAME = 'Concurrency Prime'
+# Payload completo: el PUT que crea la fila exige todos los campos obligatorios
+PLANET = {"diameter": 1, "rotation_period": 1, "orbital_period": 1, "gravity": "1", "climate": "",
+          "terrain": "", "surface_water": 1, "url": "", "description": ""}
+
+
+def hammer(threads, request):
+    barrier = threading.Barrier(threads)
+    statuses = []
+    lock = threading.Lock()
+
+    def worker(i):
+        client = app.test_client()
+        barrier.wait()
+        status = request(client, i)
+        with lock:
+            statuses.append(status)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return statuses
+
+
+def count_rows():
+    with app.app_context():
+        return db.session.execute(db.select(db.func.count()).where(Planet.name == NAME)).scalar()
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.delete(Planet).where(Planet.name == NAME))
+        db.session.commit()
+
+    statuses = hammer(threads, lambda client, i: client.put(
+        f'/planet/by-name/{NAME}', json={**PLANET, "population": i}).status_code)
+    created, updated = statuses.count(201), statuses.count(200)
+    print(f'PUT  x{threads}: {created} created, {updated} updated, other {sorted(set(statuses) - {200, 201})}')
+    ok = created == 1 and updated == threads - 1
+
+    with app.app_context():
+        db.session.execute(db.delete(Planet).where(Planet.name == NAME))
+        db.session.commit()
+    statuses = hammer(threads, lambda client, i: client.post(
+        '/planet', json={**PLANET, "name": NAME, "population": i}).status_code)
+    created, duplicates = statuses.count(201), statuses.count(400)
+    print(f'POST x{threads}: {created} created, {duplicates} duplicates, other {sorted(set(statuses) - {201, 400})}')
+    ok = ok and created == 1 and duplicates == threads - 1
+
+    rows = count_rows()
+    print(f'rows named {NAME!r}: {rows}')
+    if DB_PATH:
+        os.remove(DB_PATH)
+    sys.exit(0 if ok and rows == 1 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""add version column to catalog tables
+
+Revision ID: 3c7d9e2a51f0
+Revises: b41ab2a8f2fa
+Create Date: 2026-10-19 09:12:40.118274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7d9e2a51f0'
+down_revision = 'b41ab2a8f2fa'
+branch_labels = None
+depends_on = None
+
+CATALOG_TABLES = ['person', 'planet', 'film', 'starship', 'vehicle']
+
+
+def upgrade():
+    for table in CATALOG_TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in CATALOG_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,39 @@
+"""idempotency keys shared by every worker
+
+Revision ID: 4b9e2d7c1a08
+Revises: d7f3b9a1c6e5
+Create Date: 2026-10-19 20:12:41.377205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9e2d7c1a08'
+down_revision = 'd7f3b9a1c6e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('scope', sa.String(length=128), nullable=False),
+    sa.Column('method', sa.String(length=8), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('fingerprint', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=True),
+    sa.Column('body', sa.LargeBinary(), nullable=True),
+    sa.Column('headers', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('scope', 'method', 'path', 'key', name='uq_idempotency_key')
+    )
+    op.create_index(op.f('ix_idempotency_key_created_at'), 'idempotency_key', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_idempotency_key_created_at'), table_name='idempotency_key')
+    op.drop_table('idempotency_key')
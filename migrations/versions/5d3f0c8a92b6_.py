@@ -0,0 +1,35 @@
+"""index name columns used for lookups and admin search
+
+Revision ID: 5d3f0c8a92b6
+Revises: e2b8a4f61c93
+Create Date: 2026-10-19 15:20:37.842190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d3f0c8a92b6'
+down_revision = 'e2b8a4f61c93'
+branch_labels = None
+depends_on = None
+
+NAME_COLUMNS = [
+    ('user', 'name'),
+    ('person', 'name'),
+    ('planet', 'name'),
+    ('starship', 'name'),
+    ('vehicle', 'name'),
+    ('film', 'title'),
+]
+
+
+def upgrade():
+    for table, column in NAME_COLUMNS:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
+
+
+def downgrade():
+    for table, column in NAME_COLUMNS:
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
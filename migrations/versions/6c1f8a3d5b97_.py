@@ -0,0 +1,59 @@
+"""required catalog columns are NOT NULL
+
+Revision ID: 6c1f8a3d5b97
+Revises: 4b9e2d7c1a08
+Create Date: 2026-10-19 21:34:08.615290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1f8a3d5b97'
+down_revision = '4b9e2d7c1a08'
+branch_labels = None
+depends_on = None
+
+S, I = sa.String(), sa.Integer()
+REQUIRED = {
+    'person': [('name', S), ('height', I), ('mass', I), ('hair_color', S), ('skin_color', S), ('eye_color', S),
+               ('birth_year', S), ('gender', S), ('homeworld', S), ('url', S), ('description', S)],
+    'planet': [('name', S), ('diameter', I), ('rotation_period', I), ('orbital_period', I), ('gravity', S),
+               ('population', I), ('climate', S), ('terrain', S), ('surface_water', I), ('url', S),
+               ('description', S)],
+    'film': [('title', S), ('episode_id', I), ('director', S), ('producer', S), ('release_date', S),
+             ('opening_crawl', S), ('url', S), ('description', S)],
+    'starship': [('name', S), ('model', S), ('starship_class', S), ('manufacturer', S), ('cost_in_credits', I),
+                 ('length', I), ('crew', S), ('passengers', S), ('max_atmosphering_speed', S),
+                 ('hyperdrive_rating', S), ('MGLT', I), ('cargo_capacity', I), ('consumables', S), ('url', S),
+                 ('description', S)],
+    'vehicle': [('name', S), ('model', S), ('vehicle_class', S), ('manufacturer', S), ('cost_in_credits', I),
+                ('length', S), ('crew', S), ('passengers', S), ('max_atmosphering_speed', S),
+                ('cargo_capacity', I), ('consumables', S), ('url', S), ('description', S)],
+}
+KEYS = {'film': 'title'}
+
+
+def upgrade():
+    conn = op.get_bind()
+    for table, columns in REQUIRED.items():
+        key = KEYS.get(table, 'name')
+        # Un texto vacío dice lo mismo que el null de las filas antiguas; un número o la clave no se inventan
+        for column, type_ in columns:
+            if isinstance(type_, sa.String) and column != key:
+                conn.execute(sa.text(f'UPDATE {table} SET "{column}" = \'\' WHERE "{column}" IS NULL'))
+        missing = [column for column, type_ in columns
+                   if conn.execute(sa.text(f'SELECT 1 FROM {table} WHERE "{column}" IS NULL LIMIT 1')).first()]
+        if missing:
+            raise RuntimeError(f'{table} rows with null {missing} must be filled in before upgrading')
+        with op.batch_alter_table(table) as batch_op:
+            for column, type_ in columns:
+                batch_op.alter_column(column, existing_type=type_, nullable=False)
+
+
+def downgrade():
+    for table, columns in REQUIRED.items():
+        with op.batch_alter_table(table) as batch_op:
+            for column, type_ in columns:
+                batch_op.alter_column(column, existing_type=type_, nullable=True)
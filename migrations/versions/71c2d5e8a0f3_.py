@@ -0,0 +1,42 @@
+"""unique natural keys for ON CONFLICT upserts
+
+Revision ID: 71c2d5e8a0f3
+Revises: 9a6e1f3c7b24
+Create Date: 2026-10-19 17:05:48.120934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71c2d5e8a0f3'
+down_revision = '9a6e1f3c7b24'
+branch_labels = None
+depends_on = None
+
+NATURAL_KEYS = [
+    ('person', 'name'),
+    ('planet', 'name'),
+    ('starship', 'name'),
+    ('vehicle', 'name'),
+    ('film', 'title'),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    for table, column in NATURAL_KEYS:
+        duplicates = conn.execute(sa.text(
+            f'SELECT {column} FROM {table} WHERE {column} IS NOT NULL '
+            f'GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 5')).scalars().all()
+        if duplicates:
+            raise RuntimeError(f'Duplicate {table}.{column} values must be merged before upgrading: {duplicates}')
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=True)
+
+
+def downgrade():
+    for table, column in NATURAL_KEYS:
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
@@ -0,0 +1,74 @@
+"""polymorphic favourite table
+
+Revision ID: 8f14c6b0d2e7
+Revises: 3c7d9e2a51f0
+Create Date: 2026-10-19 10:02:13.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f14c6b0d2e7'
+down_revision = '3c7d9e2a51f0'
+branch_labels = None
+depends_on = None
+
+# Mismo orden de prioridad en que se asigna la fila original
+ENTITY_TYPES = ['person', 'planet', 'film', 'starship', 'vehicle']
+
+
+def upgrade():
+    with op.batch_alter_table('favourite') as batch_op:
+        batch_op.add_column(sa.Column('entity_type', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('entity_id', sa.Integer(), nullable=True))
+
+    # La fila original pasa a apuntar a su primera columna no nula...
+    cases = ' '.join(f"WHEN favourite_{t} IS NOT NULL THEN '{t}'" for t in ENTITY_TYPES)
+    op.execute(
+        f"UPDATE favourite SET entity_type = CASE {cases} END, "
+        f"entity_id = COALESCE({', '.join(f'favourite_{t}' for t in ENTITY_TYPES)})"
+    )
+    # ...y cada columna adicional rellena se convierte en su propia fila
+    for t in ENTITY_TYPES:
+        op.execute(
+            f"INSERT INTO favourite (id_user, entity_type, entity_id) "
+            f"SELECT id_user, '{t}', favourite_{t} FROM favourite "
+            f"WHERE favourite_{t} IS NOT NULL AND entity_type <> '{t}'"
+        )
+    op.execute("DELETE FROM favourite WHERE entity_type IS NULL")
+    op.execute(
+        "DELETE FROM favourite WHERE id_favourite NOT IN ("
+        "SELECT keep_id FROM (SELECT MIN(id_favourite) AS keep_id FROM favourite "
+        "GROUP BY id_user, entity_type, entity_id) AS keep)"
+    )
+
+    # En SQLite las claves foráneas no tienen nombre; el modo batch las descarta con la columna
+    named_constraints = op.get_bind().dialect.name != 'sqlite'
+    with op.batch_alter_table('favourite') as batch_op:
+        for t in ENTITY_TYPES:
+            if named_constraints:
+                batch_op.drop_constraint(f'favourite_favourite_{t}_fkey', type_='foreignkey')
+            batch_op.drop_column(f'favourite_{t}')
+        batch_op.alter_column('entity_type', existing_type=sa.String(length=16), nullable=False)
+        batch_op.alter_column('entity_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_unique_constraint('uq_favourite_user_entity', ['id_user', 'entity_type', 'entity_id'])
+        batch_op.create_index('ix_favourite_entity', ['entity_type', 'entity_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('favourite') as batch_op:
+        for t in ENTITY_TYPES:
+            batch_op.add_column(sa.Column(f'favourite_{t}', sa.Integer(), nullable=True))
+
+    for t in ENTITY_TYPES:
+        op.execute(f"UPDATE favourite SET favourite_{t} = entity_id WHERE entity_type = '{t}'")
+
+    with op.batch_alter_table('favourite') as batch_op:
+        batch_op.drop_index('ix_favourite_entity')
+        batch_op.drop_constraint('uq_favourite_user_entity', type_='unique')
+        batch_op.drop_column('entity_id')
+        batch_op.drop_column('entity_type')
+        for t in ENTITY_TYPES:
+            batch_op.create_foreign_key(f'favourite_favourite_{t}_fkey', t, [f'favourite_{t}'], ['id'])
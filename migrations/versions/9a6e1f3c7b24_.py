@@ -0,0 +1,34 @@
+"""change log for the /changes feed
+
+Revision ID: 9a6e1f3c7b24
+Revises: 5d3f0c8a92b6
+Create Date: 2026-10-19 16:42:11.508391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6e1f3c7b24'
+down_revision = '5d3f0c8a92b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity_type', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=8), nullable=False),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index(op.f('ix_change_log_created_at'), 'change_log', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_change_log_created_at'), table_name='change_log')
+    op.drop_table('change_log')
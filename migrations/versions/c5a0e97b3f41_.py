@@ -0,0 +1,36 @@
+"""popularity counters
+
+Revision ID: c5a0e97b3f41
+Revises: 8f14c6b0d2e7
+Create Date: 2026-10-19 11:26:51.704119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a0e97b3f41'
+down_revision = '8f14c6b0d2e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('popularity',
+    sa.Column('entity_type', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('favourite_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('entity_type', 'entity_id')
+    )
+    op.create_index('ix_popularity_top', 'popularity', ['entity_type', 'favourite_count'], unique=False)
+
+    op.execute(
+        "INSERT INTO popularity (entity_type, entity_id, favourite_count) "
+        "SELECT entity_type, entity_id, COUNT(*) FROM favourite GROUP BY entity_type, entity_id"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_popularity_top', table_name='popularity')
+    op.drop_table('popularity')
@@ -0,0 +1,61 @@
+"""person homeworld foreign key and film association tables
+
+Revision ID: d7f3b9a1c6e5
+Revises: 71c2d5e8a0f3
+Create Date: 2026-10-19 18:40:12.503318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f3b9a1c6e5'
+down_revision = '71c2d5e8a0f3'
+branch_labels = None
+depends_on = None
+
+FILM_LINKS = [
+    ('film_character', 'person_id', 'person'),
+    ('film_planet', 'planet_id', 'planet'),
+    ('film_starship', 'starship_id', 'starship'),
+    ('film_vehicle', 'vehicle_id', 'vehicle'),
+]
+
+
+def upgrade():
+    with op.batch_alter_table('person') as batch_op:
+        batch_op.add_column(sa.Column('homeworld_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_person_homeworld_id_planet', 'planet', ['homeworld_id'], ['id'],
+                                    ondelete='SET NULL')
+        batch_op.create_index(op.f('ix_person_homeworld_id'), ['homeworld_id'], unique=False)
+
+    # El texto libre de homeworld se enlaza con el planeta del mismo nombre (o la misma url)
+    op.execute(
+        "UPDATE person SET homeworld_id = ("
+        "SELECT planet.id FROM planet "
+        "WHERE lower(planet.name) = lower(trim(person.homeworld)) OR planet.url = person.homeworld "
+        "ORDER BY planet.id LIMIT 1) "
+        "WHERE homeworld IS NOT NULL"
+    )
+
+    for table, column, target in FILM_LINKS:
+        op.create_table(table,
+        sa.Column('film_id', sa.Integer(), nullable=False),
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['film_id'], ['film.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint([column], [f'{target}.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('film_id', column)
+        )
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
+
+
+def downgrade():
+    for table, column, target in FILM_LINKS:
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
+        op.drop_table(table)
+
+    with op.batch_alter_table('person') as batch_op:
+        batch_op.drop_index(op.f('ix_person_homeworld_id'))
+        batch_op.drop_constraint('fk_person_homeworld_id_planet', type_='foreignkey')
+        batch_op.drop_column('homeworld_id')
@@ -0,0 +1,32 @@
+"""cache invalidation table
+
+Revision ID: e2b8a4f61c93
+Revises: c5a0e97b3f41
+Create Date: 2026-10-19 13:48:05.296713
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8a4f61c93'
+down_revision = 'c5a0e97b3f41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_invalidation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('origin', sa.String(length=128), nullable=False),
+    sa.Column('tables', sa.String(), nullable=False),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_cache_invalidation_created_at'), 'cache_invalidation', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_cache_invalidation_created_at'), table_name='cache_invalidation')
+    op.drop_table('cache_invalidation')
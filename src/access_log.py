@@ -0,0 +1,121 @@
+"""
+Structured JSON access log written from a background thread
+
+Request threads only put a dict on a bounded queue; when the queue is full the
+record is dropped and counted instead of blocking the request.
+"""
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity
+from metrics import sql_stats
+
+logger = logging.getLogger('access')
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, capacity):
+        super().__init__(queue.Queue(maxsize=capacity))
+        self.capacity = capacity
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def prepare(self, record):
+        # El formateo se hace en el hilo del listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, separators=(',', ':'))
+
+
+class AccessLog:
+    def __init__(self, app):
+        self.handler = DroppingQueueHandler(app.config['ACCESS_LOG_QUEUE_SIZE'])
+        path = app.config['ACCESS_LOG_FILE']
+        target = logging.FileHandler(path) if path else logging.StreamHandler(sys.stdout)
+        target.setFormatter(JSONFormatter())
+        self.target = target
+        self.listener = None
+        self.pid = None
+        self.lock = threading.Lock()
+        logger.addHandler(self.handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    # El hilo del listener no sobrevive al fork de gunicorn: se arranca en cada proceso
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.listener = QueueListener(self.handler.queue, self.target)
+                self.listener.start()
+                self.pid = os.getpid()
+
+    def stats(self):
+        return {
+            "queued": self.handler.queue.qsize(),
+            "capacity": self.handler.capacity,
+            "dropped": self.handler.dropped,
+        }
+
+
+def current_user_id():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # La ruta no verificó ningún token
+        return None
+
+
+def init_access_log(app):
+    if not app.config['ACCESS_LOG_ENABLED']:
+        return
+    access_log = AccessLog(app)
+
+    def start_timer():
+        access_log.ensure_started()
+        g.access_start = time.perf_counter()
+
+    # Antes que snapshot e imagen, que pueden responder sin pasar por el resto
+    app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+
+    @app.after_request
+    def log_request(response):
+        start = g.get('access_start')
+        if start is None:
+            return response
+        sql_count, sql_time = sql_stats()
+        logger.info({
+            "ts": time.time(),
+            "method": request.method,
+            "route": request.url_rule.rule if request.url_rule else None,
+            "path": request.path,
+            "status": response.status_code,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+            "db_ms": round(sql_time * 1000, 3),
+            "db_queries": sql_count,
+            "bytes": response.content_length,
+            "user_id": current_user_id(),
+            "remote_addr": request.remote_addr,
+        })
+        return response
+
+    @app.route('/metrics/access-log', methods=['GET'])
+    def access_log_metrics():
+        return access_log.stats(), 200
@@ -1,24 +1,190 @@
 import os
+from flask import current_app, g
 from flask_admin import Admin
 from models import db, User, Favourite, Person, Planet, Starship, Vehicle, Film
 from flask_admin.contrib.sqla import ModelView
 from flask_jwt_extended import JWTManager
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import defer
+from cache import TTLCache, on_change
+
+# Último id de cada página ya vista: (tabla, vista, orden descendente, página) -> id
+keyset_boundaries = TTLCache(ttl=600, max_size=4096)
+
+
+@on_change
+def drop_keyset_boundaries(tables):
+    # Tras insertar o borrar filas las fronteras guardadas ya no coinciden con las páginas por OFFSET
+    keyset_boundaries.clear(lambda key: key[0] in tables)
+
+
+def prefix_range(column, prefix):
+    """``column`` starts with ``prefix``, as a range the column's index can seek."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+def estimate_count(session, table):
+    """Row estimate from the planner statistics, or None when there is none."""
+    dialect = session.get_bind().dialect.name
+    try:
+        if dialect == 'postgresql':
+            estimate = session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": f'"{table}"'}).scalar()
+        elif dialect == 'sqlite':
+            stat = session.execute(
+                text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table LIMIT 1"), {"table": table}).scalar()
+            estimate = int(stat.split()[0]) if stat else None
+        elif dialect == 'mysql':
+            estimate = session.execute(
+                text("SELECT table_rows FROM information_schema.tables "
+                     "WHERE table_schema = DATABASE() AND table_name = :table"), {"table": table}).scalar()
+        else:
+            estimate = None
+    except Exception:
+        # sqlite_stat1 no existe hasta el primer ANALYZE
+        session.rollback()
+        return None
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
+class FastListView(ModelView):
+    """
+    List view for large tables: estimated counts, keyset paging on the
+    primary key, long text columns deferred and prefix-only search.
+    """
+    page_size = 50
+    can_set_page_size = False
+    column_display_pk = True
+    # Columnas de texto largo que no se cargan en el listado
+    column_deferred = ()
+
+    def get_query(self):
+        query = super().get_query()
+        if self.column_deferred:
+            query = query.options(*[defer(getattr(self.model, column)) for column in self.column_deferred])
+        after = g.get('admin_keyset_after')
+        if after is not None:
+            pk = self._primary_key_column()
+            query = query.filter(pk < after if g.admin_keyset_desc else pk > after)
+        return query
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        # Solo búsquedas por prefijo (o exactas con '='), como rango sobre la columna sin
+        # CAST ni ILIKE para que sean un SEARCH en el índice de name/title y no un SCAN
+        for term in search.split():
+            exact = term.startswith('=')
+            term = term.lstrip('^=')
+            if not term:
+                continue
+            conditions = []
+            count_conditions = []
+            for field, path in self._search_fields:
+                query, joins, alias = self._apply_path_joins(query, joins, path, inner_join=False)
+                column = field if alias is None else getattr(alias, field.key)
+                conditions.append(column == term if exact else prefix_range(column, term))
+                if count_query is not None:
+                    count_query, count_joins, count_alias = self._apply_path_joins(
+                        count_query, count_joins, path, inner_join=False)
+                    column = field if count_alias is None else getattr(count_alias, field.key)
+                    count_conditions.append(column == term if exact else prefix_range(column, term))
+            query = query.filter(or_(*conditions))
+            if count_query is not None:
+                count_query = count_query.filter(or_(*count_conditions))
+        return query, count_query, joins, count_joins
+
+    def search_placeholder(self):
+        return 'Search (prefix, case-sensitive)'
+
+    def get_count_query(self):
+        if g.get('admin_skip_count'):
+            return None
+        return super().get_count_query()
+
+    def _primary_key_column(self):
+        return getattr(self.model, self._primary_key)
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        unfiltered = not search and not filters
+        if sort_column is None:
+            sort_column = self._primary_key
+
+        estimate = None
+        if unfiltered:
+            estimate = estimate_count(self.session, self.model.__tablename__)
+            if estimate is not None and estimate < current_app.config['ADMIN_ESTIMATE_THRESHOLD']:
+                estimate = None
+
+        keyset = unfiltered and execute and sort_column == self._primary_key
+        table = self.model.__tablename__
+        after = keyset_boundaries.get((table, self.endpoint, bool(sort_desc), page)) if keyset and page else None
+
+        g.admin_skip_count = estimate is not None
+        g.admin_keyset_after = after
+        g.admin_keyset_desc = bool(sort_desc)
+        try:
+            count, rows = super().get_list(0 if after is not None else page, sort_column, sort_desc,
+                                           search, filters, execute, page_size)
+        finally:
+            g.admin_skip_count = False
+            g.admin_keyset_after = None
+
+        if keyset and rows:
+            keyset_boundaries.set((table, self.endpoint, bool(sort_desc), (page or 0) + 1),
+                                  getattr(rows[-1], self._primary_key))
+        return (estimate if estimate is not None else count), rows
+
+
+class CatalogView(FastListView):
+    column_exclude_list = ('description', 'opening_crawl', 'url')
+    column_deferred = ('description',)
+    column_searchable_list = ('name',)
+
+
+class PersonView(CatalogView):
+    # El planeta de origen se carga en la misma consulta que la página
+    column_select_related_list = (Person.homeworld_planet,)
+
+
+class FilmView(CatalogView):
+    column_deferred = ('description', 'opening_crawl')
+    column_searchable_list = ('title',)
+    # Los enlaces de la película solo se editan aquí; se buscan por nombre en vez de cargar cada tabla entera
+    form_ajax_refs = {name: {'fields': ('name',), 'page_size': 20}
+                      for name in ('characters', 'planets', 'starships', 'vehicles')}
+
+
+class UserView(FastListView):
+    column_exclude_list = ('password',)
+    column_searchable_list = ('name',)
+
+
+class FavouriteView(FastListView):
+    column_list = ('id_favourite', 'user', 'entity_type', 'entity_id')
+    # Carga el usuario en la misma consulta en vez de una consulta por fila
+    column_select_related_list = (Favourite.user,)
+    column_filters = ('id_user', 'entity_type', 'entity_id')
+
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
+    app.config.setdefault('ADMIN_ESTIMATE_THRESHOLD', 10000)
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Favourite, db.session))
-    admin.add_view(ModelView(Person, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(Starship, db.session))
-    admin.add_view(ModelView(Vehicle, db.session))
-    admin.add_view(ModelView(Film, db.session))
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(FavouriteView(Favourite, db.session))
+    admin.add_view(PersonView(Person, db.session))
+    admin.add_view(CatalogView(Planet, db.session))
+    admin.add_view(CatalogView(Starship, db.session))
+    admin.add_view(CatalogView(Vehicle, db.session))
+    admin.add_view(FilmView(Film, db.session))
 
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
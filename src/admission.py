@@ -0,0 +1,160 @@
+"""
+Admission control: shed low-priority requests while the database is struggling
+
+Tracks in-flight requests, a decaying average of request latency and of the
+time spent waiting for a pooled connection. While any of them is over its
+target, low-priority endpoints (lists, exports, batch reads) are rejected
+straight away with 503 and Retry-After instead of queueing on the pool;
+critical endpoints (login and favourite writes) are always admitted and
+everything else only hits the hard in-flight cap.
+"""
+import math
+import threading
+import time
+from flask import g, jsonify, request
+from sqlalchemy.pool import QueuePool
+
+CRITICAL_ENDPOINTS = {
+    'login',
+    'add_favourite',
+    'delete_user_favourite',
+}
+
+LOW_PRIORITY_ENDPOINTS = {
+    'get_users',
+    'get_persons',
+    'get_planets',
+    'get_films',
+    'get_starships',
+    'get_vehicles',
+    'get_top',
+    'batch_get',
+    'list_changes',
+    'export_table',
+}
+
+# Respuestas largas por diseño: cuentan como en curso pero no en la latencia media
+UNTIMED_ENDPOINTS = {'export_table'}
+
+
+class DecayingAverage:
+    """EWMA that also decays towards zero while no samples arrive."""
+
+    def __init__(self, alpha=0.2, half_life=5.0):
+        self.alpha = alpha
+        self.half_life = half_life
+        self.value = 0.0
+        self.updated_at = time.monotonic()
+
+    def _decayed(self, now):
+        # Si ya no llegan muestras (todo se rechaza) la media no se queda alta para siempre
+        return self.value * math.pow(0.5, (now - self.updated_at) / self.half_life)
+
+    def add(self, sample):
+        now = time.monotonic()
+        self.value = (1 - self.alpha) * self._decayed(now) + self.alpha * sample
+        self.updated_at = now
+
+    def get(self):
+        return self._decayed(time.monotonic())
+
+
+class AdmissionController:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.latency = DecayingAverage()
+        self.pool_wait = DecayingAverage()
+        self.admitted = 0
+        self.shed = 0
+        self.configure({})
+
+    def configure(self, config):
+        self.latency_target = config.get('ADMISSION_LATENCY_TARGET', 0.5)
+        self.pool_wait_target = config.get('ADMISSION_POOL_WAIT_TARGET', 0.05)
+        self.low_priority_max_in_flight = config.get('ADMISSION_LOW_PRIORITY_MAX_IN_FLIGHT', 16)
+        self.max_in_flight = config.get('ADMISSION_MAX_IN_FLIGHT', 64)
+        self.retry_after = config.get('ADMISSION_RETRY_AFTER', 2)
+
+    def record_pool_wait(self, seconds):
+        with self.lock:
+            self.pool_wait.add(seconds)
+
+    def overloaded(self):
+        return (self.latency.get() > self.latency_target
+                or self.pool_wait.get() > self.pool_wait_target
+                or self.in_flight >= self.low_priority_max_in_flight)
+
+    def admit(self, endpoint):
+        with self.lock:
+            if endpoint not in CRITICAL_ENDPOINTS:
+                if self.in_flight >= self.max_in_flight or \
+                        (endpoint in LOW_PRIORITY_ENDPOINTS and self.overloaded()):
+                    self.shed += 1
+                    return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self, elapsed=None):
+        with self.lock:
+            self.in_flight -= 1
+            if elapsed is not None:
+                self.latency.add(elapsed)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "latency_avg": self.latency.get(),
+                "pool_wait_avg": self.pool_wait.get(),
+                "overloaded": self.overloaded(),
+                "admitted": self.admitted,
+                "shed": self.shed,
+            }
+
+
+controller = AdmissionController()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            controller.record_pool_wait(time.perf_counter() - start)
+
+
+def init_pool_timing(app):
+    """Measure pool waits on the server databases; call it before ``db.init_app``."""
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})['poolclass'] = TimedQueuePool
+
+
+def init_admission(app):
+    controller.configure(app.config)
+    if not app.config['ADMISSION_ENABLED']:
+        return
+
+    @app.before_request
+    def admit_request():
+        if not controller.admit(request.endpoint):
+            response = jsonify({"msg": "Server busy, retry later"})
+            response.headers['Retry-After'] = str(controller.retry_after)
+            return response, 503
+        g.admission_start = time.perf_counter()
+
+    @app.teardown_request
+    def release_request(exc):
+        start = g.pop('admission_start', None)
+        if start is not None:
+            untimed = request.endpoint in UNTIMED_ENDPOINTS
+            controller.release(None if untimed else time.perf_counter() - start)
+
+    @app.route('/metrics/admission', methods=['GET'])
+    def admission_metrics():
+        return controller.stats(), 200
@@ -3,13 +3,36 @@ This module takes care of starting the API Server, Loading the DB and Adding the
 """
 import os
 from admin import setup_admin
-from flask import Flask, request, jsonify, url_for
+from flask import Flask, g, request, jsonify, url_for
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from models import db, User, Person, Planet, Film, Starship, Vehicle, Favourite
-from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from utils import APIException, generate_sitemap, parse_ids, check_batch_size
+from models import db, User, Person, Planet, Film, Starship, Vehicle, Favourite, CATALOG_MODELS
+import popularity
+from replica import init_replica, RoutingSession
+from cache import cached_response, init_change_tracking, response_cache
+from compression import init_compression
+from snapshot import init_snapshot
+from catalog_image import init_catalog_image
+from invalidation import init_invalidation
+from idempotency import idempotent
+from profiler import init_profiler
+from tracing import init_tracing, jwt_required
+from access_log import init_access_log
+from export import init_export
+from admission import init_admission, init_pool_timing
+from sqlite_tuning import init_sqlite
+import idempotency
+import statements
+import changes
+import upsert
+import favourites_cache
+import relations
+from validation import validate, validator_for
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity
 
 
 app = Flask(__name__)
@@ -25,11 +48,88 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
+replica_url = os.getenv("DATABASE_REPLICA_URL")
+if replica_url is not None:
+    app.config['DATABASE_REPLICA_URL'] = replica_url.replace(
+        "postgres://", "postgresql://")
+app.config['READ_STICKY_SECONDS'] = int(os.getenv("READ_STICKY_SECONDS", 5))
+app.config['RESPONSE_CACHE_TTL'] = int(os.getenv("RESPONSE_CACHE_TTL", 300))
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+app.config['COMPRESS_LEVEL_GZIP'] = 6
+app.config['COMPRESS_LEVEL_BR'] = 5
+app.config['SNAPSHOT_DIR'] = os.getenv("SNAPSHOT_DIR", "/tmp/catalog_snapshot")
+app.config['SNAPSHOT_SERVE'] = os.getenv("SNAPSHOT_SERVE", "0") == "1"
+app.config['SNAPSHOT_COMPRESS'] = True
+app.config['CATALOG_IMAGE_PATH'] = os.getenv("CATALOG_IMAGE_PATH", "/tmp/catalog.img")
+app.config['CATALOG_IMAGE_SERVE'] = os.getenv("CATALOG_IMAGE_SERVE", "0") == "1"
+app.config['CATALOG_IMAGE_CHECK_INTERVAL'] = 1.0
+app.config['CACHE_BUS'] = os.getenv("CACHE_BUS", "local")
+app.config['CACHE_BUS_INTERVAL'] = float(os.getenv("CACHE_BUS_INTERVAL", 0.05))
+app.config['CACHE_BUS_POLL_INTERVAL'] = float(os.getenv("CACHE_BUS_POLL_INTERVAL", 0.5))
+# Mayor que el retraso máximo entre created_at y el commit (y que el desfase de relojes entre hosts)
+app.config['CACHE_BUS_POLL_OVERLAP'] = float(os.getenv("CACHE_BUS_POLL_OVERLAP", 5.0))
+app.config['CACHE_BUS_SOCKET_DIR'] = os.getenv("CACHE_BUS_SOCKET_DIR", "/tmp/cache_bus")
+app.config['IDEMPOTENCY_TTL'] = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+app.config['IDEMPOTENCY_MAX_KEYS'] = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000))
+app.config['ADMIN_ESTIMATE_THRESHOLD'] = int(os.getenv("ADMIN_ESTIMATE_THRESHOLD", 10000))
+app.config['PROFILER_TOKEN'] = os.getenv("PROFILER_TOKEN")
+app.config['PROFILER_SAMPLE_RATE'] = float(os.getenv("PROFILER_SAMPLE_RATE", 0))
+app.config['PROFILE_DIR'] = os.getenv("PROFILE_DIR", "/tmp/profiles")
+app.config['PROFILER_KEEP'] = int(os.getenv("PROFILER_KEEP", 200))
+app.config['TRACING_ENABLED'] = os.getenv("TRACING_ENABLED", "0") == "1"
+app.config['TRACING_EXPORTER'] = os.getenv("TRACING_EXPORTER", "ring")
+app.config['TRACING_RING_SIZE'] = int(os.getenv("TRACING_RING_SIZE", 500))
+app.config['TRACING_FILE'] = os.getenv("TRACING_FILE", "/tmp/traces.jsonl")
+app.config['TRACING_OTLP_ENDPOINT'] = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+app.config['TRACING_SERVICE_NAME'] = os.getenv("TRACING_SERVICE_NAME", "sw-api")
+app.config['ACCESS_LOG_ENABLED'] = os.getenv("ACCESS_LOG_ENABLED", "1") == "1"
+app.config['ACCESS_LOG_FILE'] = os.getenv("ACCESS_LOG_FILE")
+app.config['ACCESS_LOG_QUEUE_SIZE'] = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", 10000))
+app.config['EXPORT_BATCH_SIZE'] = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+app.config['CHANGE_FEED_PAGE_SIZE'] = int(os.getenv("CHANGE_FEED_PAGE_SIZE", 500))
+app.config['CHANGE_FEED_MAX_PAGE_SIZE'] = 5000
+app.config['CHANGE_FEED_SETTLE'] = float(os.getenv("CHANGE_FEED_SETTLE", 1.0))
+app.config['ADMISSION_ENABLED'] = os.getenv("ADMISSION_ENABLED", "1") == "1"
+app.config['ADMISSION_LATENCY_TARGET'] = float(os.getenv("ADMISSION_LATENCY_TARGET", 0.5))
+app.config['ADMISSION_POOL_WAIT_TARGET'] = float(os.getenv("ADMISSION_POOL_WAIT_TARGET", 0.05))
+app.config['ADMISSION_LOW_PRIORITY_MAX_IN_FLIGHT'] = int(os.getenv("ADMISSION_LOW_PRIORITY_MAX_IN_FLIGHT", 16))
+app.config['ADMISSION_MAX_IN_FLIGHT'] = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 64))
+app.config['ADMISSION_RETRY_AFTER'] = 2
+app.config['USER_FAVOURITES_CACHE_TTL'] = int(os.getenv("USER_FAVOURITES_CACHE_TTL", 300))
+app.config['SQLITE_TUNED'] = os.getenv("SQLITE_TUNED", "1") == "1"
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+app.config['SQLITE_WRITE_RETRIES'] = int(os.getenv("SQLITE_WRITE_RETRIES", 3))
+app.config['BULK_MAX_BATCH_SIZE'] = int(os.getenv("BULK_MAX_BATCH_SIZE", 100))
+app.config['TOP_CACHE_TTL'] = int(os.getenv("TOP_CACHE_TTL", 60))
+app.config['EXPAND_MAX_DEPTH'] = int(os.getenv("EXPAND_MAX_DEPTH", 3))
+
+init_replica(app)
+init_pool_timing(app)
 MIGRATE = Migrate(app, db)
 db.init_app(app)
+init_sqlite(app)
+init_change_tracking(RoutingSession)
+changes.init_changes(app, RoutingSession)
+popularity.top_cache.ttl = app.config['TOP_CACHE_TTL']
+response_cache.ttl = app.config['RESPONSE_CACHE_TTL']
+favourites_cache.user_favourites.ttl = app.config['USER_FAVOURITES_CACHE_TTL']
+idempotency.store.ttl = app.config['IDEMPOTENCY_TTL']
+idempotency.store.max_size = app.config['IDEMPOTENCY_MAX_KEYS']
 
 CORS(app)
+init_tracing(app, [User, Favourite, Person, Planet, Film, Starship, Vehicle])
+init_profiler(app)
+# Registrado antes que la compresión para medir los bytes enviados
+init_access_log(app)
+init_compression(app)
+init_snapshot(app)
+init_catalog_image(app)
+# Después de snapshot e imagen: lo que sirven ellos no toca la base de datos
+init_admission(app)
+init_invalidation(app)
+init_export(app)
 app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
 
 setup_admin(app)
@@ -37,6 +137,8 @@ jwt = JWTManager(app)
 
 @app.errorhandler(APIException)
 def handle_invalid_usage(error):
+    # Puede llegar tras una consulta: se cierra la transacción (y el BEGIN IMMEDIATE) antes de responder
+    db.session.rollback()
     return jsonify(error.to_dict()), error.status_code
 
 @app.route('/')
@@ -44,6 +146,7 @@ def sitemap():
     return generate_sitemap(app)
 
 @app.route('/register', methods=['POST'])
+@idempotent
 def register():
     data = request.get_json()
     name = data.get('name')
@@ -63,7 +166,7 @@ def login():
     name = data.get('name')
     password = data.get('password')
 
-    user = User.query.filter_by(name=name, password=password).first()
+    user = statements.first(statements.USER_BY_CREDENTIALS, name=name, password=password)
     
     if user is None:
         return jsonify({"msg": "Invalid credentials"}), 401
@@ -79,10 +182,13 @@ def delete_user(id_user):
         if user is None:
             return jsonify({"msg": "Usuario no encontrado"}), 404
         
+        popularity.decrement_for_user(id_user)
         Favourite.query.filter_by(id_user=id_user).delete()
 
         db.session.delete(user)  
+        favourites_cache.handled_by_route()
         db.session.commit()  
+        favourites_cache.invalidate_user(id_user)
 
         return jsonify({"msg": f"Usuario {id_user} eliminado exitosamente"}), 200
     except Exception as e:
@@ -90,7 +196,10 @@ def delete_user(id_user):
         return jsonify({"msg": "No se pudo eliminar el usuario", "error": str(e)}), 500
 
 @app.route('/user', methods=['GET'])
+@cached_response('user')
 def get_users():
+    if 'ids' in request.args:
+        return get_many('user')
     users = User.query.all()
     if not users:
         return jsonify({"msg": "No users found"}), 404
@@ -106,16 +215,14 @@ def get_users():
 
 
 @app.route('/user/<int:id_user>', methods=['GET'])
+@cached_response('user')
 def get_user_by_id(id_user):
-    users = User.query.all()
-    users_list = list(map(lambda user: user.serialize(), users))
-    filtered_users = list(
-        filter(lambda user: user['id'] == id_user, users_list))
+    user = statements.by_id('user', id_user)
 
-    if len(filtered_users) == 0:
+    if user is None:
         return jsonify({"msg": "User not found"}), 404
 
-    return jsonify(filtered_users[0]), 200
+    return jsonify(user.serialize()), 200
 
 
 @app.route('/user/<int:id_user>/favourites', methods=['GET'])
@@ -126,22 +233,30 @@ def get_user_favourites(id_user):
     if current_user_id != id_user:
         return jsonify({"msg": "Not authorized"}), 403
 
-    user = User.query.get(id_user)
-
-    if user is None:
-        return jsonify({"msg": "User not found"}), 404
+    entry = favourites_cache.get(current_user_id)
+    if entry is None:
+        version = favourites_cache.current_version()
+        user = statements.by_id('user', id_user)
 
-    favourites = user.favourites
+        if user is None:
+            return jsonify({"msg": "User not found"}), 404
 
-    if not favourites:
-        return jsonify({"msg": "No favourites found for this user"}), 404
+        user_favourites = statements.all_rows(statements.USER_FAVOURITES, id_user=id_user)
 
-    # Usamos map para serializar cada objeto Favourite en la lista
-    serialized_favourites = list(map(lambda favourite: favourite.serialize(), favourites))
+        if not user_favourites:
+            # También se cachea: la mayoría de usuarios no tiene favoritos
+            response, status = jsonify({"msg": "No favourites found for this user"}), 404
+        else:
+            # Usamos map para serializar cada objeto Favourite en la lista
+            serialized_favourites = list(map(lambda favourite: favourite.serialize(), user_favourites))
+            response, status = jsonify(serialized_favourites), 200
+        entry = favourites_cache.store(current_user_id, version, response.get_data(), status)
 
-    return jsonify(serialized_favourites), 200
+    g.cache_entry = entry
+    return app.response_class(entry.body, status=entry.status, mimetype=entry.mimetype)
 
 @app.route('/favourite', methods=['POST'])
+@idempotent
 def add_favourite():
     data = request.get_json()
     
@@ -150,11 +265,11 @@ def add_favourite():
 
     id_user = data['id_user']
 
-    user = User.query.get(id_user)
+    user = statements.by_id('user', id_user)
     if user is None:
         return jsonify({"msg": "User not found"}), 404
 
-    favourite_data = {'id_user': id_user}
+    wanted = []
 
     for key in ['favourite_planet', 'favourite_person', 'favourite_film', 'favourite_starship', 'favourite_vehicle']:
         if key in data:
@@ -162,35 +277,37 @@ def add_favourite():
             if entity_id is None:
                 continue  # Skip this iteration if entity_id is None
 
-            entity = None
             entity_type = key.split('_')[1]
 
-            existing_favourite = Favourite.query.filter_by(id_user=id_user).filter_by(**{key: entity_id}).first()
-            if existing_favourite:
-                return jsonify({"msg": f"Duplicate favourite for {entity_type}"}), 400
-
-            if entity_type == 'planet':
-                entity = Planet.query.get(entity_id)
-            elif entity_type == 'person':
-                entity = Person.query.get(entity_id)
-            elif entity_type == 'film':
-                entity = Film.query.get(entity_id)
-            elif entity_type == 'starship':
-                entity = Starship.query.get(entity_id)
-            elif entity_type == 'vehicle':
-                entity = Vehicle.query.get(entity_id)
-
+            entity = statements.by_id(entity_type, entity_id)
             if entity is None:
                 return jsonify({"msg": f"{entity_type.capitalize()} not found"}), 404
-            
-            favourite_data[key] = entity_id
 
-    new_favourite = Favourite(**favourite_data)
+            wanted.append((entity_type, entity_id))
+
+    if not wanted:
+        return jsonify({"msg": "Missing fields"}), 400
 
-    db.session.add(new_favourite)
+    # ON CONFLICT DO NOTHING sobre uq_favourite_user_entity: sin SELECT previo ni carreras
+    id_favourites = []
+    for entity_type, entity_id in wanted:
+        id_favourite = upsert.insert_if_absent(
+            Favourite, {"id_user": id_user, "entity_type": entity_type, "entity_id": entity_id},
+            conflict_columns=['id_user', 'entity_type', 'entity_id'])
+        if id_favourite is None:
+            db.session.rollback()
+            return jsonify({"msg": f"Duplicate favourite for {entity_type}"}), 400
+        popularity.increment(entity_type, entity_id)
+        id_favourites.append(id_favourite)
+    favourites_cache.handled_by_route()
     db.session.commit()
+    favourites_cache.invalidate_user(id_user)
 
-    return jsonify({"msg": "Favourite added successfully", "id_favourite": new_favourite.id_favourite}), 201
+    return jsonify({
+        "msg": "Favourite added successfully",
+        "id_favourite": id_favourites[0],
+        "id_favourites": id_favourites
+    }), 201
 
 
 @app.route('/user/<int:id_user>/favourites/<int:id_favourite>', methods=['DELETE'])
@@ -208,17 +325,72 @@ def delete_user_favourite(id_user, id_favourite):
         return jsonify({"msg": "Favourite does not belong to the user"}), 403
 
     db.session.delete(favourite)
+    popularity.increment(favourite.entity_type, favourite.entity_id, -1)
+    favourites_cache.handled_by_route()
     db.session.commit()
+    favourites_cache.invalidate_user(id_user)
 
     return jsonify({"msg": "Favourite deleted successfully"}), 200   
 
+def parse_if_match(value):
+    if value is None or value.strip() == '*':
+        return None
+    value = value.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise APIException("Invalid If-Match header", status_code=400)
+
+def patch_entity(model, entity_id, label):
+    data = relations.link_values(model.__tablename__, validate(model, request.get_json(), partial=True))
+
+    # Un único UPDATE con solo las columnas recibidas; version se incrementa sola
+    stmt = update(model).where(model.id == entity_id).values(**data)
+    expected_version = parse_if_match(request.headers.get('If-Match'))
+    if expected_version is not None:
+        stmt = stmt.where(model.version == expected_version)
+    stmt = stmt.execution_options(synchronize_session=False)
+
+    try:
+        if db.engine.dialect.update_returning:
+            row = db.session.execute(stmt.returning(*model.__table__.columns)).first()
+            updated = row is not None
+        else:
+            row = None
+            updated = db.session.execute(stmt).rowcount > 0
+    except IntegrityError:
+        # Índice único de name/title: renombrar a un nombre que ya existe
+        db.session.rollback()
+        return jsonify({"msg": f"{label} with that {upsert.natural_key(model)} already exists"}), 400
+    if updated:
+        changes.record(model.__tablename__, [entity_id])
+    db.session.commit()
+
+    if not updated:
+        if expected_version is not None and db.session.get(model, entity_id) is not None:
+            return jsonify({"msg": f"{label} was modified by another request"}), 412
+        return jsonify({"msg": f"{label} not found"}), 404
+
+    body = {"msg": f"{label} updated successfully"}
+    if row is not None:
+        body[label.lower()] = dict(row._mapping)
+    response = jsonify(body)
+    if row is not None:
+        response.headers['ETag'] = f'"{row.version}"'
+    return response, 200
+
 @app.route('/person', methods=['GET'])
+@cached_response('person', related=relations.related_tables('person'))
 def get_persons():
+    if 'ids' in request.args:
+        return get_many('person')
     persons = Person.query.all()
     if not persons:
         return jsonify({"msg": "No persons found"}), 404
 
-    person_list = list(map(lambda person: person.serialize(), persons))
+    person_list = relations.expand_items('person', [person.serialize() for person in persons])
 
     response_body = {
         "msg": "Hello, this is your GET /person response",
@@ -229,40 +401,24 @@ def get_persons():
 
 
 @app.route('/person/<int:id_person>', methods=['GET'])
+@cached_response('person', related=relations.related_tables('person'))
 def get_person_by_id(id_person):
-    persons = Person.query.all()
-    person_list = list(map(lambda person: person.serialize(), persons))
-
-    filtered_persons = list(
-        filter(lambda person: person['id'] == id_person, person_list))
+    person = statements.by_id('person', id_person)
 
-    if len(filtered_persons) == 0:
+    if person is None:
         return jsonify({"msg": "Person not found"}), 404
 
-    return jsonify(filtered_persons[0]), 200
+    return jsonify(relations.expand_items('person', [person.serialize()])[0]), 200
 
 @app.route('/person', methods=['POST'])
+@idempotent
 def create_person():
-    data = request.json
-    
-    existing_person = Person.query.filter_by(name=data['name']).first()
-    if existing_person:
+    data = relations.link_values('person', validate(Person, request.get_json()))
+
+    # Un único INSERT ... ON CONFLICT DO NOTHING sobre el índice único de name
+    if upsert.insert_if_absent(Person, data) is None:
+        db.session.rollback()
         return jsonify({"msg": "Person with the same name already exists"}), 400
-    
-    person = Person(
-        name=data['name'],
-        height=data['height'],
-        mass=data['mass'],
-        hair_color=data['hair_color'],
-        skin_color=data['skin_color'],
-        eye_color=data['eye_color'],
-        birth_year=data['birth_year'],
-        gender=data['gender'],
-        homeworld=data['homeworld'],
-        url=data['url'],
-        description=data['description']
-    )
-    db.session.add(person)
     db.session.commit()
     
     return jsonify({"msg": "Person created successfully"}), 201
@@ -274,7 +430,8 @@ def delete_person(person_id):
     if not person:
         return jsonify({"msg": "Person not found"}), 404
     
-    favourites = Favourite.query.filter_by(favourite_planet=person_id).all()
+    popularity.remove_entities('person', [person_id])
+    favourites = Favourite.query.filter_by(entity_type='person', entity_id=person_id).all()
 
     for favourite in favourites:
         db.session.delete(favourite)
@@ -283,36 +440,20 @@ def delete_person(person_id):
     db.session.commit()    
     return jsonify({"msg": "Person deleted successfully"}), 200
 
-@app.route('/person/<int:person_id>', methods=['PUT'])
+@app.route('/person/<int:person_id>', methods=['PUT', 'PATCH'])
 def update_person(person_id):
-    person = Person.query.get(person_id)
-    
-    if not person:
-        return jsonify({"msg": "Person not found"}), 404
-    
-    data = request.get_json()
-    person.name = data['name']
-    person.height = data['height']
-    person.mass = data['mass']
-    person.hair_color = data['hair_color']
-    person.skin_color = data['skin_color']
-    person.eye_color = data['eye_color']
-    person.birth_year = data['birth_year']
-    person.gender = data['gender']
-    person.homeworld = data['homeworld']
-    person.url = data['url']
-    person.description = data['description']
-    
-    db.session.commit()
-    return jsonify({"msg": "Person updated successfully"}), 200
+    return patch_entity(Person, person_id, "Person")
 
 @app.route('/planet', methods=['GET'])
+@cached_response('planet', related=relations.related_tables('planet'))
 def get_planets():
+    if 'ids' in request.args:
+        return get_many('planet')
     planets = Planet.query.all()
     if not planets:
         return jsonify({"msg": "No planets found"}), 404
 
-    planet_list = list(map(lambda planet: planet.serialize(), planets))
+    planet_list = relations.expand_items('planet', [planet.serialize() for planet in planets])
 
     response_body = {
         "msg": "Hello, this is your GET /planet response",
@@ -323,43 +464,23 @@ def get_planets():
 
 
 @app.route('/planet/<int:id_planet>', methods=['GET'])
+@cached_response('planet', related=relations.related_tables('planet'))
 def get_planet_by_id(id_planet):
-    planets = Planet.query.all()
-    planet_list = list(map(lambda planet: planet.serialize(), planets))
-    filtered_planets = list(
-        filter(lambda planet: planet['id'] == id_planet, planet_list))
+    planet = statements.by_id('planet', id_planet)
 
-    if len(filtered_planets) == 0:
+    if planet is None:
         return jsonify({"msg": "Planet not found"}), 404
 
-    return jsonify(filtered_planets[0]), 200
+    return jsonify(relations.expand_items('planet', [planet.serialize()])[0]), 200
 
 @app.route('/planet', methods=['POST'])
+@idempotent
 def add_planet():
-    data = request.get_json()
-    required_attributes = ['name', 'diameter', 'rotation_period', 'orbital_period', 'gravity', 'population', 'climate', 'terrain', 'surface_water', 'url', 'description']
-    for attribute in required_attributes:
-        if attribute not in data:
-            return jsonify({"msg": f"Missing {attribute}"}), 400
+    data = validate(Planet, request.get_json())
 
-    existing_planet = Planet.query.filter_by(name=data['name']).first()
-    if existing_planet:
+    if upsert.insert_if_absent(Planet, data) is None:
+        db.session.rollback()
         return jsonify({"msg": "Planet with that name already exists"}), 400
-
-    new_planet = Planet(
-        name=data['name'],
-        diameter=data['diameter'],
-        rotation_period=data['rotation_period'],
-        orbital_period=data['orbital_period'],
-        gravity=data['gravity'],
-        population=data['population'],
-        climate=data['climate'],
-        terrain=data['terrain'],
-        surface_water=data['surface_water'],
-        url=data['url'],
-        description=data['description']
-    )
-    db.session.add(new_planet)
     db.session.commit()
     return jsonify({"msg": "Planet added successfully"}), 201
 
@@ -371,7 +492,8 @@ def delete_planet(planet_id):
         return jsonify({"msg": "Planet not found"}), 404
 
     # Buscar todos los favoritos que hacen referencia al planeta
-    favourites = Favourite.query.filter_by(favourite_planet=planet_id).all()
+    popularity.remove_entities('planet', [planet_id])
+    favourites = Favourite.query.filter_by(entity_type='planet', entity_id=planet_id).all()
 
     # Eliminar esos favoritos
     for favourite in favourites:
@@ -385,39 +507,21 @@ def delete_planet(planet_id):
 
 
 
-@app.route('/planet/<int:planet_id>', methods=['PUT'])
+@app.route('/planet/<int:planet_id>', methods=['PUT', 'PATCH'])
 def update_planet(planet_id):
-    planet = Planet.query.get(planet_id)
-    
-    if not planet:
-        return jsonify({"msg": "Planet not found"}), 404
-    
-    data = request.json
-    
-    planet.name = data.get('name', planet.name)
-    planet.diameter = data.get('diameter', planet.diameter)
-    planet.rotation_period = data.get('rotation_period', planet.rotation_period)
-    planet.orbital_period = data.get('orbital_period', planet.orbital_period)
-    planet.gravity = data.get('gravity', planet.gravity)
-    planet.population = data.get('population', planet.population)
-    planet.climate = data.get('climate', planet.climate)
-    planet.terrain = data.get('terrain', planet.terrain)
-    planet.surface_water = data.get('surface_water', planet.surface_water)
-    planet.url = data.get('url', planet.url)
-    planet.description = data.get('description', planet.description)
-    
-    db.session.commit()
-    
-    return jsonify({"msg": "Planet updated successfully"}), 200
+    return patch_entity(Planet, planet_id, "Planet")
 
 
 @app.route('/film', methods=['GET'])
+@cached_response('film', related=relations.related_tables('film'))
 def get_films():
+    if 'ids' in request.args:
+        return get_many('film')
     films = Film.query.all()
     if not films:
         return jsonify({"msg": "No films found"}), 404
 
-    film_list = list(map(lambda film: film.serialize(), films))
+    film_list = relations.expand_items('film', [film.serialize() for film in films])
 
     response_body = {
         "msg": "Hello, this is your GET /film response",
@@ -428,42 +532,24 @@ def get_films():
 
 
 @app.route('/film/<int:id_film>', methods=['GET'])
+@cached_response('film', related=relations.related_tables('film'))
 def get_film_by_id(id_film):
-    films = Film.query.all()
-    film_list = list(map(lambda film: film.serialize(), films))
-
-    filtered_films = list(
-        filter(lambda film: film['id'] == id_film, film_list))
+    film = statements.by_id('film', id_film)
 
-    if len(filtered_films) == 0:
+    if film is None:
         return jsonify({"msg": "Film not found"}), 404
 
-    return jsonify(filtered_films[0]), 200
+    return jsonify(relations.expand_items('film', [film.serialize()])[0]), 200
 
 
 @app.route('/film', methods=['POST'])
+@idempotent
 def add_film():
-    data = request.get_json()
-    required_attributes = ['title', 'episode_id', 'director', 'producer', 'release_date', 'opening_crawl', 'url', 'description']
-    for attribute in required_attributes:
-        if attribute not in data:
-            return jsonify({"msg": f"Missing {attribute}"}), 400
+    data = validate(Film, request.get_json())
 
-    existing_film = Film.query.filter_by(title=data['title']).first()
-    if existing_film:
+    if upsert.insert_if_absent(Film, data) is None:
+        db.session.rollback()
         return jsonify({"msg": "Film with that title already exists"}), 400
-
-    new_film = Film(
-        title=data['title'],
-        episode_id=data['episode_id'],
-        director=data['director'],
-        producer=data['producer'],
-        release_date=data['release_date'],
-        opening_crawl=data['opening_crawl'],
-        url=data['url'],
-        description=data['description']
-    )
-    db.session.add(new_film)
     db.session.commit()
     return jsonify({"msg": "Film added successfully"}), 201
 
@@ -474,7 +560,8 @@ def delete_film(film_id):
     if not film:
         return jsonify({"msg": "Film not found"}), 404
     
-    favourites = Favourite.query.filter_by(favourite_film=film_id).all()
+    popularity.remove_entities('film', [film_id])
+    favourites = Favourite.query.filter_by(entity_type='film', entity_id=film_id).all()
 
     for favourite in favourites:
         db.session.delete(favourite)
@@ -483,35 +570,20 @@ def delete_film(film_id):
     db.session.commit()    
     return jsonify({"msg": "Film deleted successfully"}), 200
 
-@app.route('/film/<int:film_id>', methods=['PUT'])
+@app.route('/film/<int:film_id>', methods=['PUT', 'PATCH'])
 def update_film(film_id):
-    film = Film.query.get(film_id)
-    
-    if not film:
-        return jsonify({"msg": "Film not found"}), 404
-    
-    data = request.json
-    
-    film.title = data.get('title', film.title)
-    film.episode_id = data.get('episode_id', film.episode_id)
-    film.director = data.get('director', film.director)
-    film.producer = data.get('producer', film.producer)
-    film.release_date = data.get('release_date', film.release_date)
-    film.opening_crawl = data.get('opening_crawl', film.opening_crawl)
-    film.url = data.get('url', film.url)
-    film.description = data.get('description', film.description)
-    
-    db.session.commit()
-    
-    return jsonify({"msg": "Film updated successfully"}), 200
+    return patch_entity(Film, film_id, "Film")
 
 
 @app.route('/vehicles', methods=['GET'])
+@cached_response('vehicle', related=relations.related_tables('vehicle'))
 def get_vehicles():
+    if 'ids' in request.args:
+        return get_many('vehicle')
     vehicles = Vehicle.query.all()
     if not vehicles:
         return jsonify({"msg": "No vehicles found"}), 404
-    vehicle_list = list(map(lambda vehicle: vehicle.serialize(), vehicles))
+    vehicle_list = relations.expand_items('vehicle', [vehicle.serialize() for vehicle in vehicles])
 
     response_body = {
         "msg": "Hello, this is your GET /vehicles response",
@@ -522,46 +594,23 @@ def get_vehicles():
 
 
 @app.route('/vehicles/<int:id_vehicle>', methods=['GET'])
+@cached_response('vehicle', related=relations.related_tables('vehicle'))
 def get_vehicle_by_id(id_vehicle):
-    vehicles = Vehicle.query.all()
-    vehicle_list = list(map(lambda vehicle: vehicle.serialize(), vehicles))
+    vehicle = statements.by_id('vehicle', id_vehicle)
 
-    filtered_vehicles = list(
-        filter(lambda vehicle: vehicle['id'] == id_vehicle, vehicle_list))
-
-    if len(filtered_vehicles) == 0:
+    if vehicle is None:
         return jsonify({"msg": "Vehicle not found"}), 404
 
-    return jsonify(filtered_vehicles[0]), 200
+    return jsonify(relations.expand_items('vehicle', [vehicle.serialize()])[0]), 200
 
 @app.route('/vehicles', methods=['POST'])
+@idempotent
 def add_vehicle():
-    data = request.get_json()
-    required_attributes = ['name', 'model', 'vehicle_class', 'manufacturer', 'cost_in_credits', 'length', 'crew', 'passengers', 'max_atmosphering_speed', 'cargo_capacity', 'consumables', 'url', 'description']
-    for attribute in required_attributes:
-        if attribute not in data:
-            return jsonify({"msg": f"Missing {attribute}"}), 400
+    data = validate(Vehicle, request.get_json())
 
-    existing_vehicle = Vehicle.query.filter_by(name=data['name']).first()
-    if existing_vehicle:
+    if upsert.insert_if_absent(Vehicle, data) is None:
+        db.session.rollback()
         return jsonify({"msg": "Vehicle with that name already exists"}), 400
-
-    new_vehicle = Vehicle(
-        name=data['name'],
-        model=data['model'],
-        vehicle_class=data['vehicle_class'],
-        manufacturer=data['manufacturer'],
-        cost_in_credits=data['cost_in_credits'],
-        length=data['length'],
-        crew=data['crew'],
-        passengers=data['passengers'],
-        max_atmosphering_speed=data['max_atmosphering_speed'],
-        cargo_capacity=data['cargo_capacity'],
-        consumables=data['consumables'],
-        url=data['url'],
-        description=data['description']
-    )
-    db.session.add(new_vehicle)
     db.session.commit()
     return jsonify({"msg": "Vehicle added successfully"}), 201
 
@@ -572,7 +621,8 @@ def delete_vehicle(vehicle_id):
     if not vehicle:
         return jsonify({"msg": "Vehicle not found"}), 404
     
-    favourites = Favourite.query.filter_by(favourite_vehicle=vehicle_id).all()
+    popularity.remove_entities('vehicle', [vehicle_id])
+    favourites = Favourite.query.filter_by(entity_type='vehicle', entity_id=vehicle_id).all()
 
     for favourite in favourites:
         db.session.delete(favourite)
@@ -581,40 +631,20 @@ def delete_vehicle(vehicle_id):
     db.session.commit()    
     return jsonify({"msg": "Vehicle deleted successfully"}), 200
 
-@app.route('/vehicle/<int:vehicle_id>', methods=['PUT'])
+@app.route('/vehicle/<int:vehicle_id>', methods=['PUT', 'PATCH'])
 def update_vehicle(vehicle_id):
-    vehicle = Vehicle.query.get(vehicle_id)
-    
-    if not vehicle:
-        return jsonify({"msg": "Vehicle not found"}), 404
-    
-    data = request.json
-    
-    vehicle.name = data.get('name', vehicle.name)
-    vehicle.model = data.get('model', vehicle.model)
-    vehicle.vehicle_class = data.get('vehicle_class', vehicle.vehicle_class)
-    vehicle.manufacturer = data.get('manufacturer', vehicle.manufacturer)
-    vehicle.cost_in_credits = data.get('cost_in_credits', vehicle.cost_in_credits)
-    vehicle.length = data.get('length', vehicle.length)
-    vehicle.crew = data.get('crew', vehicle.crew)
-    vehicle.passengers = data.get('passengers', vehicle.passengers)
-    vehicle.max_atmosphering_speed = data.get('max_atmosphering_speed', vehicle.max_atmosphering_speed)
-    vehicle.cargo_capacity = data.get('cargo_capacity', vehicle.cargo_capacity)
-    vehicle.consumables = data.get('consumables', vehicle.consumables)
-    vehicle.url = data.get('url', vehicle.url)
-    vehicle.description = data.get('description', vehicle.description)
-    
-    db.session.commit()
-    
-    return jsonify({"msg": "Vehicle updated successfully"}), 200
+    return patch_entity(Vehicle, vehicle_id, "Vehicle")
 
 @app.route('/starship', methods=['GET'])
+@cached_response('starship', related=relations.related_tables('starship'))
 def get_starships():
+    if 'ids' in request.args:
+        return get_many('starship')
     starships = Starship.query.all()
     if not starships:
         return jsonify({"msg": "No starships found"}), 404
 
-    starship_list = list(map(lambda starship: starship.serialize(), starships))
+    starship_list = relations.expand_items('starship', [starship.serialize() for starship in starships])
 
     response_body = {
         "msg": "Hello, this is your GET /starship response",
@@ -625,49 +655,23 @@ def get_starships():
 
 
 @app.route('/starship/<int:id_starship>', methods=['GET'])
+@cached_response('starship', related=relations.related_tables('starship'))
 def get_starship_by_id(id_starship):
-    starships = Starship.query.all()
-
-    starship_list = list(map(lambda starship: starship.serialize(), starships))
+    starship = statements.by_id('starship', id_starship)
 
-    filtered_starships = list(
-        filter(lambda starship: starship['id'] == id_starship, starship_list))
-
-    if len(filtered_starships) == 0:
+    if starship is None:
         return jsonify({"msg": "Starship not found"}), 404
 
-    return jsonify(filtered_starships[0]), 200
+    return jsonify(relations.expand_items('starship', [starship.serialize()])[0]), 200
 
 @app.route('/starship', methods=['POST'])
+@idempotent
 def add_starship():
-    data = request.get_json()
-    required_attributes = ['name', 'model', 'starship_class', 'manufacturer', 'cost_in_credits', 'length', 'crew', 'passengers', 'max_atmosphering_speed', 'hyperdrive_rating', 'MGLT', 'cargo_capacity', 'consumables', 'url', 'description']
-    for attribute in required_attributes:
-        if attribute not in data:
-            return jsonify({"msg": f"Missing {attribute}"}), 400
+    data = validate(Starship, request.get_json())
 
-    existing_starship = Starship.query.filter_by(name=data['name']).first()
-    if existing_starship:
+    if upsert.insert_if_absent(Starship, data) is None:
+        db.session.rollback()
         return jsonify({"msg": "Starship with that name already exists"}), 400
-
-    new_starship = Starship(
-        name=data['name'],
-        model=data['model'],
-        starship_class=data['starship_class'],
-        manufacturer=data['manufacturer'],
-        cost_in_credits=data['cost_in_credits'],
-        length=data['length'],
-        crew=data['crew'],
-        passengers=data['passengers'],
-        max_atmosphering_speed=data['max_atmosphering_speed'],
-        hyperdrive_rating=data['hyperdrive_rating'],
-        MGLT=data['MGLT'],
-        cargo_capacity=data['cargo_capacity'],
-        consumables=data['consumables'],
-        url=data['url'],
-        description=data['description']
-    )
-    db.session.add(new_starship)
     db.session.commit()
     return jsonify({"msg": "Starship added successfully"}), 201
 
@@ -678,7 +682,8 @@ def delete_starship(starship_id):
     if not starship:
         return jsonify({"msg": "Starship not found"}), 404
     
-    favourites = Favourite.query.filter_by(favourite_starship=starship_id).all()
+    popularity.remove_entities('starship', [starship_id])
+    favourites = Favourite.query.filter_by(entity_type='starship', entity_id=starship_id).all()
 
     for favourite in favourites:
         db.session.delete(favourite)
@@ -687,34 +692,206 @@ def delete_starship(starship_id):
     db.session.commit()    
     return jsonify({"msg": "Starship deleted successfully"}), 200
 
-@app.route('/starship/<int:starship_id>', methods=['PUT'])
+@app.route('/starship/<int:starship_id>', methods=['PUT', 'PATCH'])
 def update_starship(starship_id):
-    starship = Starship.query.get(starship_id)
-    
-    if not starship:
-        return jsonify({"msg": "Starship not found"}), 404
-    
-    data = request.json
-    
-    starship.name = data.get('name', starship.name)
-    starship.model = data.get('model', starship.model)
-    starship.starship_class = data.get('starship_class', starship.starship_class)
-    starship.manufacturer = data.get('manufacturer', starship.manufacturer)
-    starship.cost_in_credits = data.get('cost_in_credits', starship.cost_in_credits)
-    starship.length = data.get('length', starship.length)
-    starship.crew = data.get('crew', starship.crew)
-    starship.passengers = data.get('passengers', starship.passengers)
-    starship.max_atmosphering_speed = data.get('max_atmosphering_speed', starship.max_atmosphering_speed)
-    starship.hyperdrive_rating = data.get('hyperdrive_rating', starship.hyperdrive_rating)
-    starship.MGLT = data.get('MGLT', starship.MGLT)
-    starship.cargo_capacity = data.get('cargo_capacity', starship.cargo_capacity)
-    starship.consumables = data.get('consumables', starship.consumables)
-    starship.url = data.get('url', starship.url)
-    starship.description = data.get('description', starship.description)
-    
+    return patch_entity(Starship, starship_id, "Starship")
+
+@app.route('/top', methods=['GET'])
+def get_top():
+    entity_type = request.args.get('type', 'planet')
+    if entity_type not in CATALOG_MODELS:
+        return jsonify({"msg": f"Unknown type {entity_type}"}), 400
+    limit = request.args.get('limit', 10, type=int)
+    limit = max(1, min(limit, 100))
+
+    return jsonify({"type": entity_type, "top": popularity.top(entity_type, limit)}), 200
+
+@app.cli.command('repair-popularity')
+def repair_popularity():
+    """Recompute favourite counters from the favourite table."""
+    total = popularity.repair_counts()
+    print(f"Recomputed {total} popularity counters")
+
+def get_catalog_model(entity):
+    # /vehicles es la ruta de colección de los vehículos
+    entity_type = 'vehicle' if entity == 'vehicles' else entity
+    model = CATALOG_MODELS.get(entity_type)
+    if model is None:
+        raise APIException(f"Unknown resource {entity}", status_code=404)
+    return entity_type, model
+
+@app.route('/<entity>/by-name/<path:name>', methods=['PUT'])
+def upsert_by_name(entity, name):
+    # Para film la clave natural es title
+    entity_type, model = get_catalog_model(entity)
+    key_column = upsert.natural_key(model)
+    body = request.get_json()
+    if isinstance(body, dict) and body.get(key_column, name) != name:
+        return jsonify({"msg": f"{key_column} does not match the URL"}), 400
+    # Si la fila aún no existe el PUT la crea: se exigen todos los campos obligatorios
+    exists = db.session.execute(
+        select(model.id).where(getattr(model, key_column) == name)).first() is not None
+    if isinstance(body, dict) and not exists:
+        body = {**body, key_column: name}
+    data = relations.link_values(entity_type, validate(model, body, partial=exists))
+    data.pop(key_column, None)
+
+    row, created = upsert.upsert(model, name, data)
     db.session.commit()
-    
-    return jsonify({"msg": "Starship updated successfully"}), 200
+
+    label = entity_type.capitalize()
+    status = "created" if created else "updated"
+    response = jsonify({"msg": f"{label} {status} successfully", "status": status, entity_type: dict(row._mapping)})
+    response.headers['ETag'] = f'"{row.version}"'
+    return response, 201 if created else 200
+
+def get_many(entity_type):
+    # GET /<entity>?ids=1,2,3: un único IN, en el orden pedido
+    ids = parse_ids(request.args.get('ids'), app.config['BULK_MAX_BATCH_SIZE'])
+    found = statements.by_ids(entity_type, ids)
+    relations.expand_items(entity_type, list(found.values()))
+    results = [{"id": id_, "status": "found", "data": found[id_]} if id_ in found
+               else {"id": id_, "status": "not_found"} for id_ in ids]
+    return jsonify({"msg": f"Found {len(found)} of {len(ids)}", "results": results}), 200
+
+@app.route('/batch', methods=['POST'])
+def batch_get():
+    data = request.get_json()
+    if isinstance(data, dict):
+        data = data.get('requests')
+    if not isinstance(data, list) or not data:
+        return jsonify({"msg": "Expected a list of {resource, id} requests"}), 400
+    check_batch_size(data, app.config['BULK_MAX_BATCH_SIZE'])
+
+    items = []
+    wanted = {}
+    for item in data:
+        resource = item.get('resource') if isinstance(item, dict) else None
+        id_ = item.get('id') if isinstance(item, dict) else None
+        entity_type = 'vehicle' if resource == 'vehicles' else resource
+        if entity_type not in statements.BY_IDS:
+            items.append((resource, id_, None, "Unknown resource"))
+        elif not isinstance(id_, int) or isinstance(id_, bool):
+            items.append((resource, id_, None, "Invalid id"))
+        else:
+            items.append((resource, id_, entity_type, None))
+            wanted.setdefault(entity_type, set()).add(id_)
+
+    # Una consulta por tabla, no por elemento
+    found = {entity_type: statements.by_ids(entity_type, ids) for entity_type, ids in wanted.items()}
+
+    results = []
+    for resource, id_, entity_type, error in items:
+        if error:
+            results.append({"resource": resource, "id": id_, "status": "error", "msg": error})
+        elif id_ in found[entity_type]:
+            results.append({"resource": resource, "id": id_, "status": "found", "data": found[entity_type][id_]})
+        else:
+            results.append({"resource": resource, "id": id_, "status": "not_found"})
+    return jsonify({"results": results}), 200
+
+@app.route('/<entity>', methods=['DELETE'])
+def bulk_delete(entity):
+    entity_type, model = get_catalog_model(entity)
+    ids = parse_ids(request.args.get('ids'), app.config['BULK_MAX_BATCH_SIZE'])
+
+    try:
+        found = set(db.session.execute(select(model.id).where(model.id.in_(ids))).scalars())
+        if found:
+            db.session.execute(delete(Favourite).where(
+                Favourite.entity_type == entity_type, Favourite.entity_id.in_(found)))
+            # Antes de borrar las filas: los residentes de un planeta se desenlazan y registran
+            relations.remove_entities(entity_type, found)
+            db.session.execute(delete(model).where(model.id.in_(found)))
+            popularity.remove_entities(entity_type, found)
+            changes.record(entity_type, found, 'delete')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Bulk delete of %s failed", entity)
+        return jsonify({"msg": f"Could not delete {entity}"}), 500
+
+    results = [{"id": id_, "status": "deleted" if id_ in found else "not_found"} for id_ in ids]
+    return jsonify({"msg": f"Deleted {len(found)} of {len(ids)}", "results": results}), 200
+
+@app.route('/<entity>', methods=['PATCH'])
+def bulk_update(entity):
+    entity_type, model = get_catalog_model(entity)
+    data = request.get_json()
+    if not isinstance(data, list) or not data:
+        return jsonify({"msg": "Expected a list of updates"}), 400
+    check_batch_size(data, app.config['BULK_MAX_BATCH_SIZE'])
+
+    validator = validator_for(model)
+    results = []
+    candidates = {}
+    pending = {}
+    for item in data:
+        id_ = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(id_, int) or isinstance(id_, bool):
+            results.append({"id": id_, "status": "error", "msg": "Missing id"})
+            continue
+        values, errors = validator.check(item, partial=True)
+        if errors:
+            results.append({"id": id_, "status": "error", "msg": "Invalid payload", "errors": errors})
+            continue
+        if id_ in candidates:
+            results.append({"id": id_, "status": "error", "msg": "Duplicate id in batch"})
+            continue
+        candidates[id_] = {"id": id_, **values}
+        pending[id_] = {"id": id_, "status": "pending"}
+        results.append(pending[id_])
+
+    # homeworld -> homeworld_id; un id enlazado que no existe invalida solo ese elemento
+    link_errors = relations.link_text_columns(entity_type, list(candidates.values()))
+    for index, id_ in enumerate(list(candidates)):
+        if index in link_errors:
+            del candidates[id_]
+            pending[id_].update({"status": "error", "msg": "Invalid payload", "errors": link_errors[index]})
+
+    # Índice único de name/title: un nombre ya usado por otra fila (o repetido en el lote) invalida ese elemento
+    key_column = upsert.natural_key(model)
+    key = getattr(model, key_column)
+    renames = {id_: values[key_column] for id_, values in candidates.items() if values.get(key_column) is not None}
+    owners = {}
+    if renames:
+        owners = dict(db.session.execute(
+            select(key, model.id).where(key.in_(set(renames.values())))).tuples().all())
+    for id_, name in renames.items():
+        if owners.setdefault(name, id_) != id_:
+            del candidates[id_]
+            pending[id_].update({"status": "error", "msg": f"{key_column} already exists"})
+
+    try:
+        found = set()
+        if candidates:
+            found = set(db.session.execute(
+                select(model.id).where(model.id.in_(list(candidates)))).scalars())
+        # Un elemento solo con id no cambia nada: se informa como unchanged
+        rows = [candidates[id_] for id_ in found if len(candidates[id_]) > 1]
+        updated = {row['id'] for row in rows}
+        if rows:
+            # UPDATE por clave primaria: SQLAlchemy lo agrupa en executemany
+            db.session.execute(update(model), rows)
+            changes.record(entity_type, [row['id'] for row in rows])
+        db.session.commit()
+    except IntegrityError:
+        # Otra petición tomó el nombre entre la comprobación y el UPDATE: no se aplica nada
+        db.session.rollback()
+        return jsonify({"msg": f"{key_column} conflict, nothing updated",
+                        "conflicts": sorted(renames.keys() & candidates.keys())}), 409
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Bulk update of %s failed", entity)
+        return jsonify({"msg": f"Could not update {entity}"}), 500
+
+    for result in results:
+        if result["status"] == "pending":
+            if result["id"] not in found:
+                result["status"] = "not_found"
+            else:
+                result["status"] = "updated" if result["id"] in updated else "unchanged"
+    return jsonify({"msg": f"Updated {len(updated)} of {len(data)}", "results": results}), 200
 
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
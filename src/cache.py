@@ -0,0 +1,169 @@
+"""
+Small in-process caches shared by the API routes
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, make_response, request
+from sqlalchemy import event
+from replica import read_target
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """Store ``value`` only if ``key`` is missing or expired; return whether it was stored."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= now:
+                return False
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self, predicate=None):
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Versión de los datos de cada tabla, incrementada tras cada commit que la modifica
+_versions = {}
+_versions_lock = threading.Lock()
+_listeners = []
+_local_listeners = []
+
+
+def data_version(*tables):
+    return tuple(_versions.get(table, 0) for table in tables)
+
+
+def bump_versions(tables, local=True):
+    """Invalidate ``tables``; ``local`` is False when the change was made by another worker."""
+    with _versions_lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+    for callback in _listeners:
+        callback(tables)
+    if local:
+        for callback in _local_listeners:
+            callback(tables)
+
+
+def on_change(callback):
+    """Register ``callback(tables)`` to run after any commit, local or remote, that changed those tables."""
+    _listeners.append(callback)
+    return callback
+
+
+def on_local_change(callback):
+    """Register ``callback(tables)`` to run only after commits made by this process."""
+    _local_listeners.append(callback)
+    return callback
+
+
+def init_change_tracking(session_cls):
+    """Collect the tables written by each transaction and bump their versions on commit."""
+
+    @event.listens_for(session_cls, 'after_flush')
+    def collect_flushed(session, flush_context):
+        changed = session.info.setdefault('changed_tables', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            changed.add(obj.__table__.name)
+
+    @event.listens_for(session_cls, 'do_orm_execute')
+    def collect_statements(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            changed = orm_execute_state.session.info.setdefault('changed_tables', set())
+            changed.add(orm_execute_state.statement.table.name)
+
+    @event.listens_for(session_cls, 'after_commit')
+    def publish(session):
+        changed = session.info.pop('changed_tables', None)
+        if changed:
+            bump_versions(changed)
+
+    @event.listens_for(session_cls, 'after_rollback')
+    def discard(session):
+        session.info.pop('changed_tables', None)
+
+
+class CachedPayload:
+    def __init__(self, version, body, status, mimetype):
+        self.version = version
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        # Variantes comprimidas por Content-Encoding, generadas una vez por versión
+        self.encoded = {}
+
+
+response_cache = TTLCache(ttl=300, max_size=512)
+
+
+def cached_response(*tables, related=None):
+    """
+    Cache a GET view's body until one of ``tables`` changes. ``related`` returns
+    the extra tables the current request reads, e.g. through ``?expand=``.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Lo leído de la réplica puede ir por detrás del primario: entrada aparte y vida corta
+            target = read_target()
+            key = (request.full_path, target)
+            version = data_version(*tables, *(related() if related else ()))
+            entry = response_cache.get(key)
+            if entry is None or entry.version != version:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code not in (200, 404) or response.is_streamed:
+                    return response
+                entry = CachedPayload(version, response.get_data(), response.status_code, response.mimetype)
+                ttl = current_app.config['READ_STICKY_SECONDS'] if target == 'replica' else None
+                response_cache.set(key, entry, ttl)
+            g.cache_entry = entry
+            return current_app.response_class(entry.body, status=entry.status, mimetype=entry.mimetype)
+        return wrapper
+    return decorator
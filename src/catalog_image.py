@@ -0,0 +1,200 @@
+"""
+Read-only binary image of the catalog, memory-mapped and shared by every worker
+
+Layout (little endian)::
+
+    header    magic(8s) format(I) built_at_ns(Q) sections(I)
+    sections  entity_type(16s) count(I) index_offset(Q) list_entry(QIQI)
+    index     per section, sorted by id: id(q) offset(Q) length(I) gz_offset(Q) gz_length(I)
+    blobs     pre-serialized JSON documents and their gzip variants
+
+Lookups binary search the index and return slices of the mapping, so the
+pages are shared through the OS page cache instead of duplicated per worker.
+"""
+import gzip
+import mmap
+import os
+import struct
+import threading
+import time
+import click
+from flask import current_app, request
+from models import db, CATALOG_MODELS
+from cache import on_local_change
+from compression import parse_accept_encoding
+from replica import init_sticky_reads, sticky_to_primary
+from snapshot import COLLECTIONS, SNAPSHOT_ENDPOINTS, Rebuilder
+
+MAGIC = b'SWCATIMG'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIQI')
+SECTION = struct.Struct('<16sIQQIQI')
+ENTRY = struct.Struct('<qQIQI')
+
+
+def build_image(path):
+    """Serialize every catalog table into a new image and atomically replace ``path``."""
+    dumps = current_app.json.dumps
+    blobs = bytearray()
+
+    def add_blob(data):
+        raw_offset = len(blobs)
+        blobs.extend(data)
+        compressed = gzip.compress(data, compresslevel=9)
+        gz_offset = len(blobs)
+        blobs.extend(compressed)
+        return raw_offset, len(data), gz_offset, len(compressed)
+
+    sections = []
+    for entity_type, model in CATALOG_MODELS.items():
+        items = [item.serialize() for item in db.session.execute(db.select(model).order_by(model.id)).scalars()]
+        entries = [(item['id'],) + add_blob((dumps(item) + '\n').encode()) for item in items]
+        list_entry = (0, 0, 0, 0)
+        if items:
+            collection, key = COLLECTIONS[entity_type]
+            body = {"msg": f"Hello, this is your GET /{collection} response", key: items}
+            list_entry = add_blob((dumps(body) + '\n').encode())
+        sections.append((entity_type, entries, list_entry))
+
+    index_start = HEADER.size + SECTION.size * len(sections)
+    blob_start = index_start + ENTRY.size * sum(len(entries) for _, entries, _ in sections)
+
+    def absolute(entry):
+        raw_offset, length, gz_offset, gz_length = entry
+        return raw_offset + blob_start, length, gz_offset + blob_start, gz_length
+
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, time.time_ns(), len(sections)))
+    index = bytearray()
+    for entity_type, entries, list_entry in sections:
+        out += SECTION.pack(entity_type.encode(), len(entries), index_start + len(index),
+                            *(absolute(list_entry) if list_entry[1] else list_entry))
+        for id_, *entry in entries:
+            index += ENTRY.pack(id_, *absolute(entry))
+    out += index
+    out += blobs
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(out)
+    os.replace(tmp, path)
+    return {entity_type: len(entries) for entity_type, entries, _ in sections}
+
+
+class CatalogImage:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns)
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.buffer)
+        magic, file_format, self.built_at, count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or file_format != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a catalog image')
+        self.sections = {}
+        for i in range(count):
+            name, entries, index_offset, *list_entry = SECTION.unpack_from(self.buffer, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b'\0').decode()] = (entries, index_offset, tuple(list_entry))
+
+    def _slice(self, entry, compressed):
+        offset, length, gz_offset, gz_length = entry
+        if not length:
+            return None
+        if compressed:
+            return self.view[gz_offset:gz_offset + gz_length]
+        return self.view[offset:offset + length]
+
+    def get_list(self, entity_type, compressed=False):
+        return self._slice(self.sections[entity_type][2], compressed)
+
+    def get(self, entity_type, id_, compressed=False):
+        entries, index_offset, _ = self.sections[entity_type]
+        low, high = 0, entries
+        while low < high:
+            middle = (low + high) // 2
+            entry = ENTRY.unpack_from(self.buffer, index_offset + middle * ENTRY.size)
+            if entry[0] == id_:
+                return self._slice(entry[1:], compressed)
+            if entry[0] < id_:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+
+class ImageHolder:
+    """Keeps the current mapping and remaps when another process swaps the file."""
+
+    def __init__(self, path, check_interval):
+        self.path = path
+        self.check_interval = check_interval
+        self.image = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return self.image
+        with self.lock:
+            self.checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self.image = None
+                return None
+            if self.image is None or self.image.identity != (stat.st_ino, stat.st_mtime_ns):
+                # La imagen anterior se libera cuando dejan de usarla las peticiones en curso
+                self.image = CatalogImage(self.path)
+        return self.image
+
+
+def init_catalog_image(app):
+    @app.cli.command('catalog-image')
+    @click.option('--path', default=None, help='Target file, defaults to CATALOG_IMAGE_PATH.')
+    def catalog_image(path):
+        """Build the memory-mapped catalog image."""
+        counts = build_image(path or app.config['CATALOG_IMAGE_PATH'])
+        for entity_type, count in counts.items():
+            print(f"{entity_type}: {count} documents")
+
+    if not app.config['CATALOG_IMAGE_SERVE']:
+        return
+
+    holder = ImageHolder(app.config['CATALOG_IMAGE_PATH'], app.config['CATALOG_IMAGE_CHECK_INTERVAL'])
+    rebuilder = Rebuilder(app, lambda entity_types: build_image(app.config['CATALOG_IMAGE_PATH']),
+                          'catalog-image-rebuilder')
+
+    @on_local_change
+    def rebuild_changed(tables):
+        if any(entity_type in tables for entity_type in CATALOG_MODELS):
+            rebuilder.schedule(CATALOG_MODELS)
+
+    init_sticky_reads(app)
+
+    @app.before_request
+    def serve_from_image():
+        if request.method != 'GET' or request.endpoint not in SNAPSHOT_ENDPOINTS:
+            return None
+        if request.query_string or sticky_to_primary():
+            return None
+        image = holder.current()
+        if image is None:
+            return None
+
+        entity_type, id_arg = SNAPSHOT_ENDPOINTS[request.endpoint]
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        compressed = accepted.get('gzip', accepted.get('*', 0)) > 0
+        if id_arg is None:
+            body = image.get_list(entity_type, compressed)
+        else:
+            body = image.get(entity_type, request.view_args[id_arg], compressed)
+        if body is None:
+            return None
+
+        # WSGI exige bytes: la única copia es la del documento que se envía
+        response = current_app.response_class(bytes(body), mimetype='application/json')
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['X-Catalog-Version'] = str(image.built_at)
+        response.vary.add('Accept-Encoding')
+        return response
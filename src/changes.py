@@ -0,0 +1,139 @@
+"""
+Change feed for incremental sync: ``GET /changes?since=<cursor>``
+
+Every flushed insert, update or delete of a user or catalog row appends an
+entry to ``change_log``; statements that bypass the unit of work (bulk
+updates and deletes) call ``record`` explicitly. The entry id is the cursor.
+
+Clients download the lists once, take ``next_cursor`` from ``/changes``
+without ``since`` and from then on only fetch the upserts and tombstones
+after it.
+"""
+import time
+import click
+from flask import jsonify, request
+from sqlalchemy import delete, event, func, inspect, insert, select
+from models import db, User, ChangeLog, CATALOG_MODELS
+from utils import APIException
+
+FEED_MODELS = {'user': User, **CATALOG_MODELS}
+TYPE_BY_TABLE = {model.__tablename__: entity_type for entity_type, model in FEED_MODELS.items()}
+
+
+def primary_key(model):
+    return inspect(model).primary_key[0]
+
+
+def record(entity_type, ids, op='upsert', session=None):
+    """Log changes made by statements the session hooks can't see."""
+    now = time.time()
+    rows = [{"entity_type": entity_type, "entity_id": id_, "op": op, "created_at": now} for id_ in ids]
+    if rows:
+        (session or db.session).execute(insert(ChangeLog), rows)
+
+
+def init_change_log(session_cls):
+    @event.listens_for(session_cls, 'after_flush')
+    def log_flushed(session, flush_context):
+        now = time.time()
+        rows = []
+        for objects, op in ((session.new, 'upsert'), (session.dirty, 'upsert'), (session.deleted, 'delete')):
+            for obj in objects:
+                entity_type = TYPE_BY_TABLE.get(obj.__table__.name)
+                if entity_type is None:
+                    continue
+                if op == 'upsert' and obj not in session.new and not session.is_modified(obj, include_collections=False):
+                    continue
+                entity_id = inspect(obj).mapper.primary_key_from_instance(obj)[0]
+                rows.append({"entity_type": entity_type, "entity_id": entity_id, "op": op, "created_at": now})
+        if rows:
+            # Directamente en la conexión: añadir objetos durante el flush no está permitido
+            session.connection().execute(ChangeLog.__table__.insert(), rows)
+
+
+def load_changes(since, limit, settle, types=None):
+    """(changes, next_cursor, has_more) for the entries after ``since``."""
+    stmt = select(ChangeLog).where(ChangeLog.id > since).order_by(ChangeLog.id).limit(limit + 1)
+    if types:
+        stmt = stmt.where(ChangeLog.entity_type.in_(types))
+    entries = db.session.execute(stmt).scalars().all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Las entradas más recientes pueden tener delante transacciones aún sin confirmar:
+    # se esperan ``settle`` segundos para no saltárselas
+    cutoff = time.time() - settle
+    for position, entry in enumerate(entries):
+        if entry.created_at > cutoff:
+            entries = entries[:position]
+            has_more = False
+            break
+
+    # Solo el último cambio de cada entidad dentro de la página
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.entity_type, entry.entity_id), None)
+        latest[(entry.entity_type, entry.entity_id)] = entry
+
+    wanted = {}
+    for (entity_type, entity_id), entry in latest.items():
+        if entry.op == 'upsert':
+            wanted.setdefault(entity_type, []).append(entity_id)
+    found = {}
+    for entity_type, ids in wanted.items():
+        model = FEED_MODELS[entity_type]
+        for obj in db.session.execute(select(model).where(primary_key(model).in_(ids))).scalars():
+            found[(entity_type, inspect(obj).mapper.primary_key_from_instance(obj)[0])] = obj
+
+    changes = []
+    for key, entry in latest.items():
+        obj = found.get(key) if entry.op == 'upsert' else None
+        change = {"cursor": entry.id, "type": entry.entity_type, "id": entry.entity_id,
+                  "op": "upsert" if obj is not None else "delete"}
+        if obj is not None:
+            change["data"] = obj.serialize()
+        changes.append(change)
+    next_cursor = entries[-1].id if entries else since
+    return changes, next_cursor, has_more
+
+
+def init_changes(app, session_cls):
+    init_change_log(session_cls)
+
+    @app.route('/changes', methods=['GET'])
+    def list_changes():
+        settle = app.config['CHANGE_FEED_SETTLE']
+        types = [entity_type for entity_type in request.args.get('types', '').split(',') if entity_type]
+        unknown = sorted(set(types) - set(FEED_MODELS))
+        if unknown:
+            raise APIException(f"Unknown types {', '.join(unknown)}", status_code=400)
+
+        since = request.args.get('since', type=int)
+        if since is None:
+            # Punto de partida tras una descarga completa
+            cursor = db.session.execute(
+                select(func.max(ChangeLog.id)).where(ChangeLog.created_at <= time.time() - settle)).scalar()
+            return jsonify({"changes": [], "next_cursor": cursor or 0, "has_more": False}), 200
+
+        oldest = db.session.execute(select(func.min(ChangeLog.id))).scalar()
+        if oldest is not None and since < oldest - 1:
+            return jsonify({"msg": "Cursor expired, download the lists again"}), 410
+
+        limit = max(1, min(request.args.get('limit', app.config['CHANGE_FEED_PAGE_SIZE'], type=int),
+                           app.config['CHANGE_FEED_MAX_PAGE_SIZE']))
+        changes, next_cursor, has_more = load_changes(since, limit, settle, types)
+        return jsonify({"changes": changes, "next_cursor": next_cursor, "has_more": has_more}), 200
+
+    @app.cli.command('changes-prune')
+    @click.option('--days', type=float, default=30, help='Keep entries newer than this.')
+    def changes_prune(days):
+        """Delete old change log entries; clients behind them get a 410."""
+        newest = db.session.execute(select(func.max(ChangeLog.id))).scalar()
+        if newest is None:
+            print("Deleted 0 change log entries")
+            return
+        # Siempre se conserva la última entrada para que el cursor no retroceda
+        result = db.session.execute(delete(ChangeLog).where(
+            ChangeLog.created_at < time.time() - days * 86400, ChangeLog.id < newest))
+        db.session.commit()
+        print(f"Deleted {result.rowcount} change log entries")
@@ -0,0 +1,73 @@
+"""
+Response compression negotiated on Accept-Encoding
+"""
+import gzip
+from flask import g, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv', 'application/x-ndjson'}
+
+
+def parse_accept_encoding(header):
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = parse_accept_encoding(header or '')
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    for coding in candidates:
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def init_compression(app):
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code >= 300
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None or response.content_length is None \
+                or response.content_length < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        # Las respuestas cacheadas guardan sus bytes comprimidos junto al payload
+        entry = g.get('cache_entry')
+        body = entry.encoded.get(encoding) if entry is not None else None
+        if body is None:
+            level = app.config['COMPRESS_LEVEL_BR' if encoding == 'br' else 'COMPRESS_LEVEL_GZIP']
+            body = compress(response.get_data(), encoding, level)
+            if entry is not None:
+                entry.encoded[encoding] = body
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,130 @@
+"""
+Streaming table exports as NDJSON or CSV, over HTTP and from the CLI
+
+Rows come from a server-side cursor in batches of ``EXPORT_BATCH_SIZE`` and
+each batch is encoded and written before the next one is fetched, so memory
+stays bounded whatever the size of the table.
+"""
+import csv
+import io
+import json
+import sys
+import zlib
+import click
+from flask import Response, current_app, request, stream_with_context
+from sqlalchemy import select
+from models import db, User, Favourite, CATALOG_MODELS
+from profiler import require_token
+from utils import APIException
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+EXPORT_TABLES = [*CATALOG_MODELS, 'user', 'favourite']
+
+
+def export_query(table):
+    """(statement, id column used for ranges) for an exportable table."""
+    if table in CATALOG_MODELS:
+        model = CATALOG_MODELS[table]
+        return select(*model.__table__.columns), model.id
+    if table == 'user':
+        # Nunca se exporta la contraseña
+        return select(User.id_user, User.name), User.id_user
+    if table == 'favourite':
+        return (select(Favourite.id_favourite, Favourite.id_user, User.name.label('user_name'),
+                       Favourite.entity_type, Favourite.entity_id)
+                .join(User, User.id_user == Favourite.id_user)), Favourite.id_favourite
+    raise APIException(f"Unknown table {table}", status_code=404)
+
+
+def iter_batches(stmt, id_column, from_id=None, to_id=None, batch_size=1000):
+    if from_id is not None:
+        stmt = stmt.where(id_column >= from_id)
+    if to_id is not None:
+        stmt = stmt.where(id_column <= to_id)
+    stmt = stmt.order_by(id_column).execution_options(stream_results=True, yield_per=batch_size)
+    result = db.session.execute(stmt)
+    try:
+        yield list(result.keys())
+        for rows in result.partitions():
+            yield rows
+    finally:
+        result.close()
+
+
+def encode_batches(batches, file_format):
+    columns = next(batches)
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        # Cabecera sola si la tabla está vacía
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        for rows in batches:
+            yield ''.join(json.dumps(dict(zip(columns, row)), separators=(',', ':')) + '\n'
+                          for row in rows).encode()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(table, file_format, from_id=None, to_id=None, compress=False, batch_size=1000):
+    # Tabla y formato se validan antes de empezar a enviar la respuesta
+    if file_format not in FORMATS:
+        raise APIException(f"Unknown format {file_format}", status_code=400)
+    stmt, id_column = export_query(table)
+    chunks = encode_batches(iter_batches(stmt, id_column, from_id, to_id, batch_size), file_format)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def init_export(app):
+    @app.route('/export/<table>', methods=['GET'])
+    def export_table(table):
+        require_token()
+        file_format = request.args.get('format', 'ndjson')
+        compress = request.args.get('gzip') == '1'
+        chunks = export_chunks(table, file_format,
+                               request.args.get('from_id', type=int), request.args.get('to_id', type=int),
+                               compress, app.config['EXPORT_BATCH_SIZE'])
+        filename = f'{table}.{file_format}' + ('.gz' if compress else '')
+        response = Response(stream_with_context(chunks),
+                            mimetype='application/gzip' if compress else FORMATS[file_format])
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @app.cli.command('export')
+    @click.argument('table', type=click.Choice(EXPORT_TABLES))
+    @click.option('--format', 'file_format', type=click.Choice(list(FORMATS)), default='ndjson')
+    @click.option('--from-id', type=int, default=None, help='First id to export (inclusive).')
+    @click.option('--to-id', type=int, default=None, help='Last id to export (inclusive).')
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+    @click.option('--output', '-o', type=click.Path(dir_okay=False), default=None, help='Output file, defaults to stdout.')
+    def export_command(table, file_format, from_id, to_id, compress, output):
+        """Stream a table as NDJSON or CSV."""
+        chunks = export_chunks(table, file_format, from_id, to_id, compress,
+                               current_app.config['EXPORT_BATCH_SIZE'])
+        out = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
+            else:
+                out.flush()
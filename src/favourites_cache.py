@@ -0,0 +1,45 @@
+"""
+Per-user cache of the GET /user/<id>/favourites response, keyed by JWT identity
+
+The routes that change one user's favourites drop just that user after the
+commit. Any other change to the favourite table (catalog deletes, admin edits,
+other workers through the invalidation bus) clears the whole cache.
+"""
+from flask import g, has_request_context
+from cache import CachedPayload, TTLCache, data_version, on_change
+
+user_favourites = TTLCache(ttl=300, max_size=10000)
+
+
+def get(identity):
+    return user_favourites.get(str(identity))
+
+
+def current_version():
+    return data_version('favourite')
+
+
+def store(identity, version, body, status):
+    """Cache the response unless the favourite table changed since ``version`` was read."""
+    entry = CachedPayload(version, body, status, 'application/json')
+    if current_version() == version:
+        user_favourites.set(str(identity), entry)
+    return entry
+
+
+def handled_by_route():
+    """Mark this request's favourite writes as invalidated per user by the route itself."""
+    g.favourites_invalidated = True
+
+
+def invalidate_user(id_user):
+    user_favourites.delete(str(id_user))
+
+
+@on_change
+def invalidate_favourites(tables):
+    if 'favourite' not in tables:
+        return
+    if has_request_context() and g.get('favourites_invalidated'):
+        return
+    user_favourites.clear()
@@ -0,0 +1,144 @@
+"""
+Idempotency-Key support for POST routes: retries replay the first response
+
+Keys live in the idempotency_key table, so a retry that lands on another
+worker (or host) still finds them. The unique constraint on
+(scope, method, path, key) decides which request runs the handler. Keys
+expire after ``ttl`` seconds and the table keeps at most ``max_size`` rows.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+from flask import current_app, make_response, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+from utils import APIException
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Una clave en curso más antigua que esto es de un worker que murió a medias
+IN_PROGRESS_TIMEOUT = 300
+IN_PROGRESS = object()
+
+
+class KeyStore:
+    def __init__(self, ttl=24 * 3600, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.table = IdempotencyKey.__table__
+        self.cleaned_at = 0.0
+
+    def _where(self, store_key):
+        scope, method, path, key = store_key
+        c = self.table.c
+        return c.scope == scope, c.method == method, c.path == path, c.key == key
+
+    def claim(self, store_key, fingerprint):
+        """(id of the claimed row, None) for the first request, (None, stored row or IN_PROGRESS) for retries."""
+        scope, method, path, key = store_key
+        now = time.time()
+        self.cleanup(now)
+        for _ in range(3):
+            try:
+                # Transacción propia: la reclamación es visible al resto antes de ejecutar la vista
+                with db.engine.begin() as conn:
+                    claimed = conn.execute(insert(self.table).values(
+                        scope=scope, method=method, path=path, key=key,
+                        fingerprint=fingerprint, created_at=now)).inserted_primary_key[0]
+                    # Tope de filas aunque lleguen claves únicas sin parar: se borran las más antiguas
+                    conn.execute(delete(self.table).where(self.table.c.id <= claimed - self.max_size))
+                return claimed, None
+            except IntegrityError:
+                pass
+            with db.engine.begin() as conn:
+                row = conn.execute(select(self.table).where(*self._where(store_key))).first()
+                if row is None:
+                    continue
+                expired = row.created_at < now - self.ttl or \
+                    (row.status is None and row.created_at < now - IN_PROGRESS_TIMEOUT)
+                if not expired:
+                    return None, (IN_PROGRESS if row.status is None else row)
+                # Caducada o abandonada: se libera y se vuelve a reclamar
+                conn.execute(delete(self.table).where(
+                    self.table.c.id == row.id, self.table.c.created_at == row.created_at))
+        return None, IN_PROGRESS
+
+    def finish(self, claimed, response):
+        headers = [(name, value) for name, value in response.headers
+                   if name.lower() not in ('content-length', 'set-cookie')]
+        with db.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == claimed).values(
+                status=response.status_code, body=response.get_data(), headers=json.dumps(headers)))
+
+    def release(self, claimed):
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.id == claimed))
+
+    def cleanup(self, now):
+        if now - self.cleaned_at < 60:
+            return
+        self.cleaned_at = now
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.created_at < now - self.ttl))
+
+
+store = KeyStore()
+
+
+def request_scope():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    if identity is not None:
+        return f'user:{identity}'
+    return f'ip:{request.remote_addr}'
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise APIException(f"{HEADER} too long", status_code=400)
+
+        store_key = (request_scope()[:128], request.method, request.path[:255], key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        claimed, stored = store.claim(store_key, fingerprint)
+        if claimed is None:
+            if stored is IN_PROGRESS:
+                return {"msg": "A request with this Idempotency-Key is still in progress"}, 409
+            if stored.fingerprint != fingerprint:
+                return {"msg": "Idempotency-Key was already used with a different payload"}, 422
+            response = current_app.response_class(stored.body, status=stored.status,
+                                                  headers=json.loads(stored.headers))
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            store.release(claimed)
+            raise
+        # Lo que la vista no confirmó ya no se confirma: se suelta el bloqueo de escritura
+        # antes de guardar la respuesta desde otra conexión
+        db.session.rollback()
+        if response.status_code >= 500 or response.is_streamed:
+            # Los errores del servidor se pueden reintentar
+            store.release(claimed)
+            return response
+        try:
+            store.finish(claimed, response)
+        except Exception:
+            # Sin respuesta guardada la clave quedaría "en curso": se libera para poder reintentar
+            store.release(claimed)
+            raise
+        return response
+    return wrapper
@@ -0,0 +1,265 @@
+"""
+Cross-worker cache invalidation bus
+
+Every commit made by this process publishes the tables it changed; every other
+worker applies them to its local caches. Backends:
+
+- ``local``: single process, nothing is sent
+- ``table``: rows in the cache_invalidation table, polled by each worker
+- ``unix``: datagrams to the sockets of the other workers on this host
+- ``postgres``: LISTEN/NOTIFY on the primary database
+"""
+import json
+from abc import ABC, abstractmethod
+import os
+import select
+import socket
+import threading
+import time
+from sqlalchemy import text
+from models import db
+from cache import bump_versions, on_local_change
+
+CHANNEL = 'cache_invalidation'
+
+
+class BusStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.published_batches = 0
+        self.published_tables = 0
+        self.received_batches = 0
+        self.errors = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.avg_lag = None
+
+    def record_lag(self, lag):
+        with self.lock:
+            self.received_batches += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.avg_lag = lag if self.avg_lag is None else 0.9 * self.avg_lag + 0.1 * lag
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "published_batches": self.published_batches,
+                "published_tables": self.published_tables,
+                "received_batches": self.received_batches,
+                "errors": self.errors,
+                "lag_seconds": {"last": self.last_lag, "avg": self.avg_lag, "max": self.max_lag},
+            }
+
+
+class InvalidationBus(ABC):
+    """Batching publisher and subscriber threads; backends implement ``send`` and ``receive``."""
+
+    def __init__(self, app):
+        self.app = app
+        self.backend = app.config['CACHE_BUS']
+        self.batch_interval = app.config['CACHE_BUS_INTERVAL']
+        self.stats = BusStats()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pid = None
+        self.origin = None
+
+    # Los hilos se arrancan en el primer uso de cada proceso, también tras el fork de gunicorn
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.origin = f'{socket.gethostname()}:{self.pid}'
+            self.pending = set()
+            self.setup()
+            threading.Thread(target=self.run, args=(self.publish_loop,), name='cache-bus-publisher', daemon=True).start()
+            threading.Thread(target=self.run, args=(self.subscribe_loop,), name='cache-bus-subscriber', daemon=True).start()
+
+    def run(self, loop):
+        with self.app.app_context():
+            loop()
+
+    def publish(self, tables):
+        self.ensure_started()
+        with self.lock:
+            self.pending.update(tables)
+        self.wakeup.set()
+
+    def publish_loop(self):
+        while True:
+            self.wakeup.wait()
+            # Agrupa lo que llegue durante el intervalo en un único mensaje
+            time.sleep(self.batch_interval)
+            self.wakeup.clear()
+            with self.lock:
+                tables, self.pending = self.pending, set()
+            if not tables:
+                continue
+            message = {"origin": self.origin, "tables": sorted(tables), "ts": time.time()}
+            try:
+                self.send(message)
+                with self.stats.lock:
+                    self.stats.published_batches += 1
+                    self.stats.published_tables += len(tables)
+            except Exception:
+                self.stats.record_error()
+                self.app.logger.exception('Could not publish cache invalidation')
+
+    def subscribe_loop(self):
+        while True:
+            try:
+                for message in self.receive():
+                    if message.get("origin") == self.origin:
+                        continue
+                    self.stats.record_lag(max(0.0, time.time() - message["ts"]))
+                    bump_versions(message["tables"], local=False)
+            except Exception:
+                self.stats.record_error()
+                self.app.logger.exception('Cache invalidation subscriber failed')
+                time.sleep(1)
+
+    def setup(self):
+        pass
+
+    @abstractmethod
+    def send(self, message):
+        """Deliver one ``{"origin", "tables", "ts"}`` message to the other workers."""
+
+    @abstractmethod
+    def receive(self):
+        """Yield the messages published by any worker, blocking until there are some."""
+
+
+class LocalBus(InvalidationBus):
+    # Un único proceso: nunca arranca los hilos, no hay a quién enviar ni de quién recibir
+    def send(self, message):
+        pass
+
+    def receive(self):
+        return iter(())
+
+
+class TableBus(InvalidationBus):
+    def setup(self):
+        self.poll_interval = self.app.config['CACHE_BUS_POLL_INTERVAL']
+        self.overlap = self.app.config['CACHE_BUS_POLL_OVERLAP']
+        self.since = time.time()
+        # id -> created_at de las filas ya aplicadas que siguen dentro de la ventana
+        self.seen = {}
+        self.cleaned_at = time.monotonic()
+
+    def send(self, message):
+        with db.engine.begin() as conn:
+            conn.execute(
+                text('INSERT INTO cache_invalidation (origin, tables, created_at) VALUES (:origin, :tables, :ts)'),
+                {"origin": message["origin"], "tables": ','.join(message["tables"]), "ts": message["ts"]})
+            if time.monotonic() - self.cleaned_at > 60:
+                conn.execute(text('DELETE FROM cache_invalidation WHERE created_at < :ts'),
+                             {"ts": time.time() - 300})
+                self.cleaned_at = time.monotonic()
+
+    def receive(self):
+        time.sleep(self.poll_interval)
+        # Los ids se reparten antes del commit: uno más bajo puede aparecer después de uno
+        # más alto. Se relee una ventana solapada por created_at y se descartan los ya vistos
+        window_start = self.since - self.overlap
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                text('SELECT id, origin, tables, created_at FROM cache_invalidation '
+                     'WHERE created_at > :ts ORDER BY created_at, id'),
+                {"ts": window_start}).all()
+        for row in rows:
+            if row.id in self.seen:
+                continue
+            self.seen[row.id] = row.created_at
+            self.since = max(self.since, row.created_at)
+            yield {"origin": row.origin, "tables": row.tables.split(','), "ts": row.created_at}
+        window_start = self.since - self.overlap
+        self.seen = {id_: created_at for id_, created_at in self.seen.items() if created_at > window_start}
+
+
+class UnixSocketBus(InvalidationBus):
+    def setup(self):
+        self.directory = self.app.config['CACHE_BUS_SOCKET_DIR']
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'{self.pid}.sock')
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+
+    def send(self, message):
+        payload = json.dumps(message).encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.sock') or path == self.path:
+                continue
+            try:
+                self.sock.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket de un worker que ya no existe
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def receive(self):
+        payload, _ = self.sock.recvfrom(65536)
+        yield json.loads(payload)
+
+
+class PostgresBus(InvalidationBus):
+    def setup(self):
+        self.listen_conn = None
+
+    def send(self, message):
+        with db.engine.begin() as conn:
+            conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                         {"channel": CHANNEL, "payload": json.dumps(message)})
+
+    def receive(self):
+        if self.listen_conn is None:
+            self.listen_conn = db.engine.raw_connection()
+            self.listen_conn.driver_connection.autocommit = True
+            self.listen_conn.cursor().execute(f'LISTEN {CHANNEL}')
+        conn = self.listen_conn.driver_connection
+        if select.select([conn], [], [], 5) == ([], [], []):
+            return
+        conn.poll()
+        while conn.notifies:
+            yield json.loads(conn.notifies.pop(0).payload)
+
+
+BACKENDS = {
+    'local': LocalBus,
+    'table': TableBus,
+    'unix': UnixSocketBus,
+    'postgres': PostgresBus,
+}
+
+
+def init_invalidation(app):
+    backend = app.config['CACHE_BUS']
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown CACHE_BUS backend {backend}')
+    bus = BACKENDS[backend](app)
+    app.extensions['cache_bus'] = bus
+
+    if backend != 'local':
+        on_local_change(bus.publish)
+        app.before_request(bus.ensure_started)
+
+    @app.route('/metrics/cache-bus', methods=['GET'])
+    def cache_bus_metrics():
+        return {"backend": backend, "origin": bus.origin, **bus.stats.as_dict()}, 200
+
+    return bus
@@ -0,0 +1,37 @@
+"""
+Per-request SQL timing shared by the profiler, tracing and access logs
+"""
+import time
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Callbacks (statement, parameters, start, elapsed) para cada consulta de la petición
+_statement_listeners = []
+
+
+def on_statement(callback):
+    _statement_listeners.append(callback)
+    return callback
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start'].pop()
+    if not has_request_context():
+        return
+    elapsed = time.perf_counter() - start
+    g.sql_time = g.get('sql_time', 0.0) + elapsed
+    g.sql_count = g.get('sql_count', 0) + 1
+    for callback in _statement_listeners:
+        callback(statement, parameters, start, elapsed)
+
+
+def sql_stats():
+    """(number of statements, seconds spent in them) for the current request."""
+    return g.get('sql_count', 0), g.get('sql_time', 0.0)
@@ -1,15 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import ARRAY, ForeignKey, Integer
 from sqlalchemy.orm import relationship
+from replica import RoutingSession
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class User(db.Model):
     __tablename__ = 'user'
     id_user = db.Column(db.Integer, primary_key=True, unique=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, index=True)
     password = db.Column(db.String)  
     favourites = db.relationship('Favourite', back_populates='user')
     
@@ -26,51 +27,142 @@ class User(db.Model):
 
 class Favourite(db.Model):
     __tablename__ = 'favourite'
-    
+    __table_args__ = (
+        db.UniqueConstraint('id_user', 'entity_type', 'entity_id', name='uq_favourite_user_entity'),
+        # Índice inverso para "quién marcó como favorito el planeta X"
+        db.Index('ix_favourite_entity', 'entity_type', 'entity_id'),
+    )
+
     id_favourite = db.Column(db.Integer, primary_key=True)
     id_user = db.Column(db.Integer, ForeignKey('user.id_user'))
-    favourite_planet = db.Column(db.Integer, ForeignKey('planet.id'), default=None)
-    favourite_person = db.Column(db.Integer, ForeignKey('person.id'), default=None)
-    favourite_film = db.Column(db.Integer, ForeignKey('film.id'), default=None)
-    favourite_starship = db.Column(db.Integer, ForeignKey('starship.id'), default=None)
-    favourite_vehicle = db.Column(db.Integer, ForeignKey('vehicle.id'), default=None)
+    # Uno de los tipos de CATALOG_MODELS: person, planet, film, starship o vehicle
+    entity_type = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
 
     # Relaciones
     user = relationship('User', back_populates='favourites')
-    planet = relationship('Planet')  # Asumiendo que el modelo Planet tiene un campo id_planet
-    person = relationship('Person')  # Asumiendo que el modelo Person tiene un campo id_person
-    film = relationship('Film')      # Asumiendo que el modelo Film tiene un campo id_film
-    starship = relationship('Starship') # Asumiendo que el modelo Starship tiene un campo id_starship
-    vehicle = relationship('Vehicle')   # Asumiendo que el modelo Vehicle tiene un campo id_vehicle
 
     def __repr__(self):
         return f'<Favourite {self.id_favourite}>'
 
     def serialize(self):
-        return {            
-            "id_favourite": self.id_favourite,  
+        # Mantiene el formato con una columna por tipo de la versión anterior
+        data = {
+            "id_favourite": self.id_favourite,
             "id_user": self.id_user,
-            "favourite_person": self.favourite_person,          
-            "favourite_planet": self.favourite_planet,
-            "favourite_starship": self.favourite_starship,          
-            "favourite_vehicle": self.favourite_vehicle,
-            "favourite_film": self.favourite_film
+            "favourite_person": None,
+            "favourite_planet": None,
+            "favourite_starship": None,
+            "favourite_vehicle": None,
+            "favourite_film": None
         }
-    
+        data[f"favourite_{self.entity_type}"] = self.entity_id
+        return data
+
+class Popularity(db.Model):
+    __tablename__ = 'popularity'
+    __table_args__ = (
+        db.Index('ix_popularity_top', 'entity_type', 'favourite_count'),
+    )
+
+    entity_type = db.Column(db.String(16), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    favourite_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<Popularity {self.entity_type} {self.entity_id}>'
+
+    def serialize(self):
+        return {
+            "entity_type": self.entity_type,
+            "entity_id": self.entity_id,
+            "favourite_count": self.favourite_count
+        }
+
+class CacheInvalidation(db.Model):
+    __tablename__ = 'cache_invalidation'
+    id = db.Column(db.Integer, primary_key=True)
+    origin = db.Column(db.String(128), nullable=False)
+    tables = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<CacheInvalidation {self.id}>'
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    # La restricción única es el cerrojo: solo un worker puede reclamar cada clave
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'method', 'path', 'key', name='uq_idempotency_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(128), nullable=False)
+    method = db.Column(db.String(8), nullable=False)
+    path = db.Column(db.String(255), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # NULL mientras la petición original sigue en curso
+    status = db.Column(db.Integer)
+    body = db.Column(db.LargeBinary)
+    headers = db.Column(db.Text)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.id} {self.method} {self.path}>'
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    # El id es el cursor de /changes: en SQLite AUTOINCREMENT evita reutilizar ids
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    # 'upsert' o 'delete'
+    op = db.Column(db.String(8), nullable=False)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ChangeLog {self.id} {self.op} {self.entity_type} {self.entity_id}>'
+
+# Enlaces entre películas y el resto del catálogo; la clave primaria cubre las
+# búsquedas por película y el índice de la segunda columna las inversas
+def film_link(name, column, target):
+    return db.Table(
+        name,
+        db.Column('film_id', db.Integer, ForeignKey('film.id', ondelete='CASCADE'), primary_key=True),
+        db.Column(column, db.Integer, ForeignKey(f'{target}.id', ondelete='CASCADE'), primary_key=True, index=True),
+    )
+
+
+film_character = film_link('film_character', 'person_id', 'person')
+film_planet = film_link('film_planet', 'planet_id', 'planet')
+film_starship = film_link('film_starship', 'starship_id', 'starship')
+film_vehicle = film_link('film_vehicle', 'vehicle_id', 'vehicle')
+
+
 class Person(db.Model):
     __tablename__ = 'person'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    height = db.Column(db.Integer)
-    mass = db.Column(db.Integer)
-    hair_color = db.Column(db.String)
-    skin_color = db.Column(db.String)
-    eye_color = db.Column(db.String)
-    birth_year = db.Column(db.String)
-    gender = db.Column(db.String)
-    homeworld = db.Column(db.String)
-    url = db.Column(db.String)
-    description = db.Column(db.String)
+    name = db.Column(db.String, nullable=False, index=True, unique=True)
+    height = db.Column(db.Integer, nullable=False)
+    mass = db.Column(db.Integer, nullable=False)
+    hair_color = db.Column(db.String, nullable=False)
+    skin_color = db.Column(db.String, nullable=False)
+    eye_color = db.Column(db.String, nullable=False)
+    birth_year = db.Column(db.String, nullable=False)
+    gender = db.Column(db.String, nullable=False)
+    homeworld = db.Column(db.String, nullable=False)
+    homeworld_id = db.Column(db.Integer, ForeignKey('planet.id', ondelete='SET NULL'), index=True)
+    url = db.Column(db.String, nullable=False)
+    description = db.Column(db.String, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version + 1'))
+
+    # Relaciones
+    homeworld_planet = relationship('Planet', back_populates='residents')
+    films = relationship('Film', secondary=film_character, back_populates='characters')
 
     def __repr__(self):
         return f'<Person {self.name}>'
@@ -87,24 +179,32 @@ class Person(db.Model):
             "birth_year": self.birth_year,
             "gender": self.gender,
             "homeworld": self.homeworld,
+            "homeworld_id": self.homeworld_id,
             "url": self.url,
-            "description": self.description
+            "description": self.description,
+            "version": self.version
         }
     
 class Planet(db.Model):
     __tablename__ = 'planet'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    diameter = db.Column(db.Integer)
-    rotation_period = db.Column(db.Integer)
-    orbital_period = db.Column(db.Integer)
-    gravity = db.Column(db.String)
-    population = db.Column(db.Integer)
-    climate = db.Column(db.String)
-    terrain = db.Column(db.String)
-    surface_water = db.Column(db.Integer)
-    url = db.Column(db.String)
-    description = db.Column(db.String)
+    name = db.Column(db.String, nullable=False, index=True, unique=True)
+    diameter = db.Column(db.Integer, nullable=False)
+    rotation_period = db.Column(db.Integer, nullable=False)
+    orbital_period = db.Column(db.Integer, nullable=False)
+    gravity = db.Column(db.String, nullable=False)
+    population = db.Column(db.Integer, nullable=False)
+    climate = db.Column(db.String, nullable=False)
+    terrain = db.Column(db.String, nullable=False)
+    surface_water = db.Column(db.Integer, nullable=False)
+    url = db.Column(db.String, nullable=False)
+    description = db.Column(db.String, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version + 1'))
+
+    # Relaciones
+    residents = relationship('Person', back_populates='homeworld_planet')
+    films = relationship('Film', secondary=film_planet, back_populates='planets')
 
     def __repr__(self):
         return f'<Planet {self.name}>'
@@ -122,20 +222,29 @@ class Planet(db.Model):
             "terrain": self.terrain,
             "surface_water": self.surface_water,
             "url": self.url,
-            "description": self.description
+            "description": self.description,
+            "version": self.version
         }
     
 class Film(db.Model):
     __tablename__ = 'film'
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String)
-    episode_id = db.Column(db.Integer)
-    director = db.Column(db.String)
-    producer = db.Column(db.String)
-    release_date = db.Column(db.String)
-    opening_crawl = db.Column(db.String)
-    url = db.Column(db.String)
-    description = db.Column(db.String)
+    title = db.Column(db.String, nullable=False, index=True, unique=True)
+    episode_id = db.Column(db.Integer, nullable=False)
+    director = db.Column(db.String, nullable=False)
+    producer = db.Column(db.String, nullable=False)
+    release_date = db.Column(db.String, nullable=False)
+    opening_crawl = db.Column(db.String, nullable=False)
+    url = db.Column(db.String, nullable=False)
+    description = db.Column(db.String, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version + 1'))
+
+    # Relaciones
+    characters = relationship('Person', secondary=film_character, back_populates='films')
+    planets = relationship('Planet', secondary=film_planet, back_populates='films')
+    starships = relationship('Starship', secondary=film_starship, back_populates='films')
+    vehicles = relationship('Vehicle', secondary=film_vehicle, back_populates='films')
 
     def __repr__(self):
         return f'<Film {self.title}>'
@@ -150,27 +259,33 @@ class Film(db.Model):
             "release_date": self.release_date,
             "opening_crawl": self.opening_crawl,
             "url": self.url,
-            "description": self.description
+            "description": self.description,
+            "version": self.version
         }
 
 class Starship(db.Model):
     __tablename__ = 'starship'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    model = db.Column(db.String)
-    starship_class = db.Column(db.String)
-    manufacturer = db.Column(db.String)
-    cost_in_credits = db.Column(db.Integer)
-    length = db.Column(db.Integer)
-    crew = db.Column(db.String)
-    passengers = db.Column(db.String)
-    max_atmosphering_speed = db.Column(db.String)
-    hyperdrive_rating = db.Column(db.String)
-    MGLT = db.Column(db.Integer)
-    cargo_capacity = db.Column(db.Integer)
-    consumables = db.Column(db.String)
-    url = db.Column(db.String)
-    description = db.Column(db.String)
+    name = db.Column(db.String, nullable=False, index=True, unique=True)
+    model = db.Column(db.String, nullable=False)
+    starship_class = db.Column(db.String, nullable=False)
+    manufacturer = db.Column(db.String, nullable=False)
+    cost_in_credits = db.Column(db.Integer, nullable=False)
+    length = db.Column(db.Integer, nullable=False)
+    crew = db.Column(db.String, nullable=False)
+    passengers = db.Column(db.String, nullable=False)
+    max_atmosphering_speed = db.Column(db.String, nullable=False)
+    hyperdrive_rating = db.Column(db.String, nullable=False)
+    MGLT = db.Column(db.Integer, nullable=False)
+    cargo_capacity = db.Column(db.Integer, nullable=False)
+    consumables = db.Column(db.String, nullable=False)
+    url = db.Column(db.String, nullable=False)
+    description = db.Column(db.String, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version + 1'))
+
+    # Relaciones
+    films = relationship('Film', secondary=film_starship, back_populates='starships')
 
     def __repr__(self):
         return f'<Starship {self.name}>'
@@ -192,25 +307,31 @@ class Starship(db.Model):
             "cargo_capacity": self.cargo_capacity,
             "consumables": self.consumables,
             "url": self.url,
-            "description": self.description
+            "description": self.description,
+            "version": self.version
         }
 
 class Vehicle(db.Model):
     __tablename__ = 'vehicle'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    model = db.Column(db.String)
-    vehicle_class = db.Column(db.String)
-    manufacturer = db.Column(db.String)
-    cost_in_credits = db.Column(db.Integer)
-    length = db.Column(db.String)
-    crew = db.Column(db.String)
-    passengers = db.Column(db.String)
-    max_atmosphering_speed = db.Column(db.String)
-    cargo_capacity = db.Column(db.Integer)
-    consumables = db.Column(db.String)
-    url = db.Column(db.String)
-    description = db.Column(db.String)
+    name = db.Column(db.String, nullable=False, index=True, unique=True)
+    model = db.Column(db.String, nullable=False)
+    vehicle_class = db.Column(db.String, nullable=False)
+    manufacturer = db.Column(db.String, nullable=False)
+    cost_in_credits = db.Column(db.Integer, nullable=False)
+    length = db.Column(db.String, nullable=False)
+    crew = db.Column(db.String, nullable=False)
+    passengers = db.Column(db.String, nullable=False)
+    max_atmosphering_speed = db.Column(db.String, nullable=False)
+    cargo_capacity = db.Column(db.Integer, nullable=False)
+    consumables = db.Column(db.String, nullable=False)
+    url = db.Column(db.String, nullable=False)
+    description = db.Column(db.String, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version + 1'))
+
+    # Relaciones
+    films = relationship('Film', secondary=film_vehicle, back_populates='vehicles')
 
     def __repr__(self):
         return f'<Vehicle {self.name}>'
@@ -230,5 +351,15 @@ class Vehicle(db.Model):
             "cargo_capacity": self.cargo_capacity,
             "consumables": self.consumables,
             "url": self.url,
-            "description": self.description
-        }
\ No newline at end of file
+            "description": self.description,
+            "version": self.version
+        }
+
+# Recursos del catálogo, indexados por el tipo de entidad que usa Favourite
+CATALOG_MODELS = {
+    'person': Person,
+    'planet': Planet,
+    'film': Film,
+    'starship': Starship,
+    'vehicle': Vehicle,
+}
@@ -0,0 +1,89 @@
+"""
+Favourite counters per catalog entity, kept up to date by the write routes
+"""
+from sqlalchemy import select, update, delete, insert, func, tuple_
+from models import db, Favourite, Popularity, CATALOG_MODELS
+from cache import TTLCache, on_change
+import upsert
+
+# Respuestas de /top por (entity_type, limit)
+top_cache = TTLCache(ttl=60, max_size=256)
+
+
+@on_change
+def invalidate_top(tables):
+    if 'popularity' in tables:
+        top_cache.clear()
+        return
+    # Cada entrada incluye las filas serializadas: renombrar o borrar una también la invalida
+    changed = {model.__tablename__ for model in CATALOG_MODELS.values()} & set(tables)
+    if changed:
+        top_cache.clear(lambda key: CATALOG_MODELS[key[0]].__tablename__ in changed)
+
+
+def increment(entity_type, entity_id, delta=1):
+    """Adjust the counter inside the caller's transaction, creating the row on first use."""
+    if delta > 0:
+        # Un único upsert: dos primeros favoritos simultáneos ya no chocan en la clave primaria
+        upsert.add_to_counter(Popularity, {"entity_type": entity_type, "entity_id": entity_id},
+                              'favourite_count', delta)
+        return
+    db.session.execute(
+        update(Popularity)
+        .where(Popularity.entity_type == entity_type, Popularity.entity_id == entity_id)
+        .values(favourite_count=Popularity.favourite_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def decrement_for_user(id_user):
+    """Take back every favourite of a user before they are deleted."""
+    # Se parte de los favoritos del usuario (índice por id_user) y se busca cada
+    # contador por clave primaria; un EXISTS correlacionado recorría toda la tabla
+    user_favourites = select(Favourite.entity_type, Favourite.entity_id).where(Favourite.id_user == id_user)
+    db.session.execute(
+        update(Popularity)
+        .where(tuple_(Popularity.entity_type, Popularity.entity_id).in_(user_favourites))
+        .values(favourite_count=Popularity.favourite_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def remove_entities(entity_type, entity_ids):
+    db.session.execute(
+        delete(Popularity)
+        .where(Popularity.entity_type == entity_type, Popularity.entity_id.in_(list(entity_ids)))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def top(entity_type, limit):
+    key = (entity_type, limit)
+    cached = top_cache.get(key)
+    if cached is not None:
+        return cached
+
+    model = CATALOG_MODELS[entity_type]
+    # ix_popularity_top resuelve el filtro y el orden sin ordenar en memoria
+    rows = db.session.execute(
+        select(model, Popularity.favourite_count)
+        .join(model, model.id == Popularity.entity_id)
+        .where(Popularity.entity_type == entity_type, Popularity.favourite_count > 0)
+        .order_by(Popularity.favourite_count.desc())
+        .limit(limit)
+    ).all()
+    result = [dict(entity.serialize(), favourite_count=count) for entity, count in rows]
+    top_cache.set(key, result)
+    return result
+
+
+def repair_counts():
+    """Recompute every counter from the favourite table in two set-based statements."""
+    db.session.execute(delete(Popularity))
+    db.session.execute(insert(Popularity).from_select(
+        ['entity_type', 'entity_id', 'favourite_count'],
+        select(Favourite.entity_type, Favourite.entity_id, func.count())
+        .group_by(Favourite.entity_type, Favourite.entity_id)
+    ))
+    db.session.commit()
+    return db.session.scalar(select(func.count()).select_from(Popularity))
@@ -0,0 +1,155 @@
+"""
+Opt-in per-request profiling written as pstats files to PROFILE_DIR
+"""
+import cProfile
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+import click
+from flask import abort, current_app, g, jsonify, request, send_from_directory
+from metrics import on_statement, sql_stats
+
+HEADER = 'X-Profile'
+MAX_STATEMENTS = 50
+
+
+def request_signature(token, method, path, expires):
+    """Signature that enables profiling of one route until ``expires`` without sharing the token."""
+    return hmac.new(token.encode(), f'{method} {path} {expires}'.encode(), hashlib.sha256).hexdigest()
+
+
+def signed_header(token, method, path, ttl):
+    """``X-Profile`` value for one route: ``<expires>.<signature>``."""
+    expires = int(time.time()) + ttl
+    return f'{expires}.{request_signature(token, method, path, expires)}'
+
+
+def is_authorized(value):
+    token = current_app.config['PROFILER_TOKEN']
+    if not token or not value:
+        return False
+    if hmac.compare_digest(value, token):
+        return True
+    expires, _, signature = value.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    # La caducidad va dentro de lo firmado: no se puede alargar cambiando el prefijo
+    return hmac.compare_digest(signature, request_signature(token, request.method, request.path, int(expires)))
+
+
+def should_profile():
+    if is_authorized(request.headers.get(HEADER)):
+        return True
+    rate = current_app.config['PROFILER_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+@on_statement
+def record_statement(statement, parameters, start, elapsed):
+    statements = g.get('profile_statements')
+    if statements is not None and len(statements) < MAX_STATEMENTS:
+        statements.append({"sql": statement, "ms": round(elapsed * 1000, 3)})
+
+
+def start_profile():
+    if request.endpoint in ('list_profiles', 'get_profile') or not should_profile():
+        return
+    g.profile_statements = []
+    g.profile_started = time.perf_counter()
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+
+def finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    duration = time.perf_counter() - g.profile_started
+    sql_count, sql_time = sql_stats()
+
+    directory = current_app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    route = request.url_rule.rule if request.url_rule else request.path
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request.endpoint or 'unknown'}-{os.getpid()}-{random.randrange(1 << 16):04x}"
+    profiler.dump_stats(os.path.join(directory, name + '.pstats'))
+    with open(os.path.join(directory, name + '.json'), 'w') as f:
+        json.dump({
+            "id": name,
+            "route": route,
+            "method": request.method,
+            "path": request.full_path,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "sql_count": sql_count,
+            "sql_ms": round(sql_time * 1000, 3),
+            "statements": g.profile_statements,
+            "created_at": time.time(),
+        }, f)
+    prune(directory, current_app.config['PROFILER_KEEP'])
+    response.headers['X-Profile-Id'] = name
+    return response
+
+
+def stop_profile(exc):
+    # after_request no corre si la petición se aborta con una excepción; teardown siempre
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def prune(directory, keep):
+    names = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:-keep] if keep else []:
+        for suffix in ('.json', '.pstats'):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def require_token():
+    # Solo en la cabecera: en la query string acabaría en los logs de acceso y de los proxies
+    if not is_authorized(request.headers.get(HEADER)):
+        abort(403)
+
+
+def init_profiler(app):
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(stop_profile)
+
+    @app.cli.command('profile-signature')
+    @click.argument('method')
+    @click.argument('path')
+    @click.option('--ttl', default=3600, show_default=True, help='Seconds until the signature expires.')
+    def profile_signature(method, path, ttl):
+        """Print an X-Profile header value that profiles METHOD PATH for --ttl seconds."""
+        token = app.config['PROFILER_TOKEN']
+        if not token:
+            raise click.ClickException('PROFILER_TOKEN is not set')
+        print(f'{HEADER}: {signed_header(token, method.upper(), path, ttl)}')
+
+    @app.route('/profiles', methods=['GET'])
+    def list_profiles():
+        require_token()
+        directory = app.config['PROFILE_DIR']
+        by_route = {}
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory), reverse=True):
+                if not name.endswith('.json'):
+                    continue
+                with open(os.path.join(directory, name)) as f:
+                    meta = json.load(f)
+                meta.pop('statements', None)
+                by_route.setdefault(f"{meta['method']} {meta['route']}", []).append(meta)
+        return jsonify(by_route), 200
+
+    @app.route('/profiles/<name>', methods=['GET'])
+    def get_profile(name):
+        require_token()
+        # Descarga el .pstats (para snakeviz o pstats) o el .json con las consultas
+        return send_from_directory(app.config['PROFILE_DIR'], name)
@@ -0,0 +1,283 @@
+"""
+Links between catalog entities and ``?expand=`` on the catalog GET routes
+
+``?expand=homeworld,films.characters`` adds the related rows to each item,
+nested levels separated by dots. A to-many relation is stored under its own
+name; ``homeworld`` goes to ``homeworld_planet`` so the free-text column keeps
+its value. Expansions are resolved level by level by a per-request
+``BatchLoader``: every relationship of a level is one IN query for all the
+parent rows at once (split in chunks of ``IN_CHUNK_SIZE`` ids), never one
+query per row, and rows already loaded in the request are not fetched again.
+
+The API writes ``homeworld`` as free text and ``link_text_columns`` resolves
+it to ``homeworld_id`` the same way the migration did. The film link tables
+are only edited from the admin Film form.
+"""
+from flask import current_app, g, request
+from sqlalchemy import bindparam, delete, func, or_, select, update
+from models import db, Person, CATALOG_MODELS, film_character, film_planet, film_starship, film_vehicle
+from utils import APIException
+import changes
+import statements
+
+IN_CHUNK_SIZE = 500
+
+# Tabla de enlace con las películas de cada tipo; la columna es '<tipo>_id'
+FILM_LINKS = {
+    'person': film_character,
+    'planet': film_planet,
+    'starship': film_starship,
+    'vehicle': film_vehicle,
+}
+
+# Columna de texto libre -> (clave ajena que se rellena a partir de ella, tipo enlazado)
+TEXT_LINKS = {
+    'person': {'homeworld': ('homeworld_id', 'planet')},
+}
+
+
+def chunks(ids):
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        yield ids[start:start + IN_CHUNK_SIZE]
+
+
+class ToOne:
+    """Foreign key already present in the parent row."""
+
+    def __init__(self, target, column, key):
+        self.target = target
+        self.column = column
+        # Clave de salida: no pisa la columna de texto del mismo nombre
+        self.key = key
+        self.tables = (target,)
+
+    def attach(self, loader, items, name):
+        found = loader.load(self.target, {item[self.column] for item in items if item[self.column] is not None})
+        children = []
+        for item in items:
+            target = found.get(item[self.column])
+            # Copia por padre: el mismo planeta puede expandirse distinto en otra rama
+            item[self.key] = dict(target) if target is not None else None
+            if target is not None:
+                children.append(item[self.key])
+        return children
+
+
+class ToMany:
+    """Rows pointing at the parent, directly or through a link table."""
+
+    def __init__(self, target, parent_key, target_key):
+        self.target = target
+        model = CATALOG_MODELS[target]
+        self.statement = (
+            select(parent_key, model)
+            .where(parent_key.in_(bindparam('ids', expanding=True)))
+            .order_by(parent_key, model.id)
+        )
+        if parent_key.table is not model.__table__:
+            self.statement = self.statement.join_from(parent_key.table, model, model.id == target_key)
+        self.tables = tuple({target, parent_key.table.name})
+
+    def attach(self, loader, items, name):
+        links = loader.related(self, [item['id'] for item in items])
+        children = []
+        for item in items:
+            item[name] = [dict(loader.rows[(self.target, id_)]) for id_ in links[item['id']]]
+            children.extend(item[name])
+        return children
+
+
+def film_links(target):
+    table = FILM_LINKS[target]
+    return ToMany('film', table.c[f'{target}_id'], table.c.film_id)
+
+
+def film_targets(target):
+    table = FILM_LINKS[target]
+    return ToMany(target, table.c.film_id, table.c[f'{target}_id'])
+
+
+RELATIONS = {
+    'person': {
+        'homeworld': ToOne('planet', 'homeworld_id', 'homeworld_planet'),
+        'films': film_links('person'),
+    },
+    'planet': {
+        'residents': ToMany('person', Person.__table__.c.homeworld_id, Person.__table__.c.id),
+        'films': film_links('planet'),
+    },
+    'film': {
+        'characters': film_targets('person'),
+        'planets': film_targets('planet'),
+        'starships': film_targets('starship'),
+        'vehicles': film_targets('vehicle'),
+    },
+    'starship': {'films': film_links('starship')},
+    'vehicle': {'films': film_links('vehicle')},
+}
+
+
+class BatchLoader:
+    """Serialized catalog rows and links loaded during one request."""
+
+    def __init__(self):
+        self.rows = {}
+        self.links = {}
+        self.queries = 0
+
+    def load(self, entity_type, ids):
+        """{id: serialized row} for ``ids``, with one IN query for the ones not loaded yet."""
+        missing = sorted(id_ for id_ in ids if (entity_type, id_) not in self.rows)
+        for chunk in chunks(missing):
+            found = statements.by_ids(entity_type, chunk)
+            self.queries += 1
+            for id_ in chunk:
+                self.rows[(entity_type, id_)] = found.get(id_)
+        return {id_: self.rows[(entity_type, id_)] for id_ in ids if self.rows[(entity_type, id_)] is not None}
+
+    def related(self, relation, parent_ids):
+        """{parent id: [target ids]}, loading the target rows in the same query."""
+        missing = sorted({id_ for id_ in parent_ids if (relation, id_) not in self.links})
+        for id_ in missing:
+            self.links[(relation, id_)] = []
+        for chunk in chunks(missing):
+            rows = db.session.execute(relation.statement, {"ids": chunk}).all()
+            self.queries += 1
+            for parent_id, target in rows:
+                self.rows.setdefault((relation.target, target.id), target.serialize())
+                self.links[(relation, parent_id)].append(target.id)
+        return {id_: self.links[(relation, id_)] for id_ in parent_ids}
+
+
+def loader():
+    if 'relation_loader' not in g:
+        g.relation_loader = BatchLoader()
+    return g.relation_loader
+
+
+def parse(entity_type, value):
+    """Tree of relation names from ``homeworld,films.characters``; 400 on an unknown name."""
+    tree = {}
+    if not value:
+        return tree
+    max_depth = current_app.config['EXPAND_MAX_DEPTH']
+    for path in value.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        names = path.split('.')
+        if len(names) > max_depth:
+            raise APIException(f"Expansion {path} is deeper than {max_depth} levels", status_code=400)
+        node, current = tree, entity_type
+        for name in names:
+            relation = RELATIONS.get(current, {}).get(name)
+            if relation is None:
+                raise APIException(f"Unknown expansion {path}", status_code=400,
+                                   payload={"expandable": sorted(RELATIONS.get(current, {}))})
+            node = node.setdefault(name, {})
+            current = relation.target
+    return tree
+
+
+def tables_in(entity_type, tree):
+    tables = set()
+    for name, subtree in tree.items():
+        relation = RELATIONS[entity_type][name]
+        tables.update(relation.tables)
+        tables.update(tables_in(relation.target, subtree))
+    return tables
+
+
+def related_tables(entity_type):
+    """``related`` callable for ``cached_response``: the tables this request's expansions read."""
+    def tables():
+        try:
+            tree = parse(entity_type, request.args.get('expand'))
+        except APIException:
+            return ()
+        return sorted(tables_in(entity_type, tree))
+    return tables
+
+
+def expand(entity_type, items, tree, batch_loader):
+    for name, subtree in tree.items():
+        relation = RELATIONS[entity_type][name]
+        children = relation.attach(batch_loader, items, name)
+        if subtree and children:
+            expand(relation.target, children, subtree, batch_loader)
+
+
+def expand_items(entity_type, items):
+    """Apply the request's ``?expand=`` to serialized rows of ``entity_type``, in place."""
+    tree = parse(entity_type, request.args.get('expand'))
+    if tree and items:
+        expand(entity_type, items, tree, loader())
+    return items
+
+
+def match_text(target, text):
+    """Id of the ``target`` row named ``text`` (case-insensitive, trimmed) or with that url; None if none."""
+    model = CATALOG_MODELS[target]
+    # Primero el nombre exacto, que usa el índice; lower() solo si no hay coincidencia
+    id_ = db.session.scalars(select(model.id).where(model.name == text.strip()).order_by(model.id).limit(1)).first()
+    if id_ is None:
+        id_ = db.session.scalars(
+            select(model.id)
+            .where(or_(func.lower(model.name) == func.lower(func.trim(text)), model.url == text))
+            .order_by(model.id)
+            .limit(1)
+        ).first()
+    return id_
+
+
+def link_text_columns(entity_type, items):
+    """Fill the foreign keys of ``TEXT_LINKS`` in validated ``items``, in place; {item index: errors}.
+
+    A free-text value sets the key to its matching row, or None when nothing
+    matches. A key sent explicitly wins over the text and must exist.
+    """
+    errors = {}
+    for text_column, (id_column, target) in TEXT_LINKS.get(entity_type, {}).items():
+        model = CATALOG_MODELS[target]
+        wanted = {values[id_column] for values in items if values.get(id_column) is not None}
+        found = set()
+        for chunk in chunks(sorted(wanted)):
+            found.update(db.session.scalars(select(model.id).where(model.id.in_(chunk))))
+        matches = {}
+        for index, values in enumerate(items):
+            if values.get(id_column) is not None:
+                if values[id_column] not in found:
+                    errors.setdefault(index, {})[id_column] = f"No {target} with id {values[id_column]}"
+            elif text_column in values and id_column not in values:
+                text = values[text_column]
+                if text is not None and text not in matches:
+                    matches[text] = match_text(target, text)
+                values[id_column] = matches.get(text)
+    return errors
+
+
+def link_values(entity_type, values):
+    """``link_text_columns`` for one payload; 400 when a key does not exist."""
+    errors = link_text_columns(entity_type, [values]).get(0)
+    if errors:
+        raise APIException("Invalid payload", status_code=400, payload={"errors": errors})
+    return values
+
+
+def remove_entities(entity_type, entity_ids):
+    """Drop the links of rows deleted in bulk; the ORM already does it for single deletes."""
+    entity_ids = list(entity_ids)
+    tables = FILM_LINKS.values() if entity_type == 'film' else [FILM_LINKS[entity_type]]
+    column = 'film_id' if entity_type == 'film' else f'{entity_type}_id'
+    for table in tables:
+        db.session.execute(delete(table).where(table.c[column].in_(entity_ids)))
+    if entity_type == 'planet':
+        residents = db.session.scalars(select(Person.id).where(Person.homeworld_id.in_(entity_ids))).all()
+        if residents:
+            db.session.execute(
+                update(Person)
+                .where(Person.id.in_(residents))
+                .values(homeworld_id=None)
+                .execution_options(synchronize_session=False)
+            )
+            changes.record('person', residents)
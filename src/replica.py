@@ -0,0 +1,64 @@
+"""
+Read/write splitting: GET requests read from DATABASE_REPLICA_URL when it is configured
+"""
+from flask import current_app, g, request, has_request_context
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+STICKY_COOKIE = 'read_primary'
+READ_METHODS = ('GET', 'HEAD')
+
+
+def use_replica():
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if g.get('use_primary'):
+        return False
+    # Lee del primario durante un rato después de una escritura del mismo cliente
+    return request.cookies.get(STICKY_COOKIE) is None
+
+
+def sticky_to_primary():
+    """Whether this client wrote recently and has to see its own writes."""
+    return has_request_context() and (bool(g.get('use_primary')) or STICKY_COOKIE in request.cookies)
+
+
+def read_target():
+    """'replica' when this request's reads go to the replica engine, 'primary' otherwise."""
+    if use_replica() and REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {}):
+        return 'replica'
+    return 'primary'
+
+
+class RoutingSession(Session):
+    """Session that sends reads of GET requests to the replica engine and everything else to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and use_replica():
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_replica(app):
+    """Register the replica bind; call it before ``db.init_app``."""
+    replica_url = app.config.get('DATABASE_REPLICA_URL')
+    if not replica_url:
+        return
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = replica_url
+    init_sticky_reads(app)
+
+
+def init_sticky_reads(app):
+    """Mark clients that just wrote so their next reads skip replicas and prebuilt copies."""
+    if app.extensions.get('sticky_reads'):
+        return
+    app.extensions['sticky_reads'] = True
+
+    @app.after_request
+    def mark_sticky(response):
+        if request.method not in READ_METHODS and request.method != 'OPTIONS' and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=app.config['READ_STICKY_SECONDS'],
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,179 @@
+"""
+Static JSON snapshot of the catalog, exported to disk and served with send_file
+"""
+import gzip
+import os
+import threading
+import click
+from flask import current_app, request, send_file
+from models import db, CATALOG_MODELS
+from cache import on_local_change
+from compression import brotli, choose_encoding
+from replica import init_sticky_reads, sticky_to_primary
+
+# Ruta de colección y clave de la lista de cada tipo, igual que las rutas GET
+COLLECTIONS = {
+    'person': ('person', 'persons'),
+    'planet': ('planet', 'planets'),
+    'film': ('film', 'films'),
+    'starship': ('starship', 'starships'),
+    'vehicle': ('vehicles', 'vehicles'),
+}
+
+# endpoint -> (tipo, argumento con el id o None para la lista)
+SNAPSHOT_ENDPOINTS = {
+    'get_persons': ('person', None),
+    'get_person_by_id': ('person', 'id_person'),
+    'get_planets': ('planet', None),
+    'get_planet_by_id': ('planet', 'id_planet'),
+    'get_films': ('film', None),
+    'get_film_by_id': ('film', 'id_film'),
+    'get_starships': ('starship', None),
+    'get_starship_by_id': ('starship', 'id_starship'),
+    'get_vehicles': ('vehicle', None),
+    'get_vehicle_by_id': ('vehicle', 'id_vehicle'),
+}
+
+
+def _write_atomic(path, data, compress):
+    variants = {path: data}
+    if compress:
+        variants[path + '.gz'] = gzip.compress(data, compresslevel=9)
+        if brotli is not None:
+            variants[path + '.br'] = brotli.compress(data, quality=11)
+    for target, payload in variants.items():
+        tmp = f'{target}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, target)
+
+
+def _remove(path):
+    for target in (path, path + '.gz', path + '.br'):
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+
+
+def export_entity(directory, entity_type, compress=True):
+    model = CATALOG_MODELS[entity_type]
+    path, key = COLLECTIONS[entity_type]
+    dumps = current_app.json.dumps
+    item_dir = os.path.join(directory, entity_type)
+    os.makedirs(item_dir, exist_ok=True)
+
+    items = [item.serialize() for item in db.session.execute(db.select(model).order_by(model.id)).scalars()]
+    for item in items:
+        _write_atomic(os.path.join(item_dir, f"{item['id']}.json"), (dumps(item) + '\n').encode(), compress)
+
+    list_path = os.path.join(directory, f'{entity_type}.json')
+    if items:
+        body = {"msg": f"Hello, this is your GET /{path} response", key: items}
+        _write_atomic(list_path, (dumps(body) + '\n').encode(), compress)
+    else:
+        # Sin fichero la petición cae a la base de datos, que responde el 404
+        _remove(list_path)
+
+    live = {f"{item['id']}.json" for item in items}
+    for name in os.listdir(item_dir):
+        if name.endswith('.json') and name not in live:
+            _remove(os.path.join(item_dir, name))
+    return len(items)
+
+
+def export_snapshot(directory, entity_types=None, compress=True):
+    os.makedirs(directory, exist_ok=True)
+    return {entity_type: export_entity(directory, entity_type, compress)
+            for entity_type in (entity_types or CATALOG_MODELS)}
+
+
+class Rebuilder:
+    """Background thread that calls ``build(entity_types)`` for the types changed by recent commits."""
+
+    def __init__(self, app, build, name):
+        self.app = app
+        self.build = build
+        self.name = name
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def schedule(self, entity_types):
+        with self.lock:
+            self.pending.update(entity_types)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            with self.lock:
+                entity_types, self.pending = self.pending, set()
+            if not entity_types:
+                continue
+            with self.app.app_context():
+                try:
+                    self.build(entity_types)
+                except Exception:
+                    self.app.logger.exception('%s failed', self.name)
+                finally:
+                    db.session.remove()
+
+
+def serve_from_snapshot():
+    if request.method != 'GET' or request.endpoint not in SNAPSHOT_ENDPOINTS:
+        return None
+    # Con parámetros o justo después de una escritura propia se responde desde la base de datos
+    if request.query_string or sticky_to_primary():
+        return None
+
+    entity_type, id_arg = SNAPSHOT_ENDPOINTS[request.endpoint]
+    directory = current_app.config['SNAPSHOT_DIR']
+    if id_arg is None:
+        path = os.path.join(directory, f'{entity_type}.json')
+    else:
+        path = os.path.join(directory, entity_type, f'{request.view_args[id_arg]}.json')
+    if not os.path.exists(path):
+        return None
+
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    suffix = {'gzip': '.gz', 'br': '.br'}.get(encoding)
+    if suffix and os.path.exists(path + suffix):
+        response = send_file(path + suffix, mimetype='application/json', conditional=True)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_file(path, mimetype='application/json', conditional=True)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_snapshot(app):
+    @app.cli.command('snapshot-export')
+    @click.option('--dir', 'directory', default=None, help='Target directory, defaults to SNAPSHOT_DIR.')
+    @click.option('--compress/--no-compress', default=True, help='Also write .gz (and .br) files.')
+    def snapshot_export(directory, compress):
+        """Export every catalog table and document as static JSON files."""
+        counts = export_snapshot(directory or app.config['SNAPSHOT_DIR'], compress=compress)
+        for entity_type, count in counts.items():
+            print(f"{entity_type}: {count} documents")
+
+    if not app.config['SNAPSHOT_SERVE']:
+        return
+
+    rebuilder = Rebuilder(app, lambda entity_types: export_snapshot(
+        app.config['SNAPSHOT_DIR'], entity_types, app.config['SNAPSHOT_COMPRESS']), 'snapshot-rebuilder')
+
+    @on_local_change
+    def rebuild_changed(tables):
+        changed = [entity_type for entity_type in CATALOG_MODELS if entity_type in tables]
+        if changed:
+            rebuilder.schedule(changed)
+
+    # Quien acaba de escribir lee de la base de datos hasta que se regenere la copia
+    init_sticky_reads(app)
+    app.before_request(serve_from_snapshot)
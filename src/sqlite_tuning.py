@@ -0,0 +1,119 @@
+"""
+Production settings for running on SQLite
+
+- PRAGMAs on every new connection: WAL journal, synchronous=NORMAL, mmap,
+  page cache and busy_timeout
+- write endpoints open their transaction with BEGIN IMMEDIATE, so they queue
+  on busy_timeout up front instead of failing with "database is locked" when
+  a read transaction tries to upgrade to a write
+- one writer at a time per process, and a few retries with backoff when the
+  lock is still held by another worker after busy_timeout
+"""
+import random
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from models import db
+from replica import READ_METHODS
+
+_write_lock = threading.Lock()
+
+# Rutas que escriben. POST /login y POST /batch solo leen: no deben esperar al escritor
+WRITE_ENDPOINTS = {
+    'register',
+    'delete_user',
+    'add_favourite',
+    'delete_user_favourite',
+    'create_person', 'delete_person', 'update_person',
+    'add_planet', 'delete_planet', 'update_planet',
+    'add_film', 'delete_film', 'update_film',
+    'add_vehicle', 'delete_vehicle', 'update_vehicle',
+    'add_starship', 'delete_starship', 'update_starship',
+    'upsert_by_name',
+    'bulk_delete',
+    'bulk_update',
+}
+
+# Vistas de flask-admin que escriben (con POST), p. ej. 'person.edit_view'
+ADMIN_WRITE_VIEWS = ('create_view', 'edit_view', 'delete_view', 'action_view', 'ajax_update')
+
+
+def is_write_request():
+    if not has_request_context() or request.endpoint is None:
+        return False
+    if request.endpoint in WRITE_ENDPOINTS:
+        return True
+    return request.method not in READ_METHODS and request.endpoint.rpartition('.')[2] in ADMIN_WRITE_VIEWS
+
+
+def is_locked_error(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def tune_engine(engine, config):
+    pragmas = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA mmap_size={config['SQLITE_MMAP_SIZE']}",
+        # Negativo: tamaño en KiB en lugar de en páginas
+        f"PRAGMA cache_size=-{config['SQLITE_CACHE_SIZE_KB']}",
+        f"PRAGMA busy_timeout={config['SQLITE_BUSY_TIMEOUT']}",
+        'PRAGMA temp_store=MEMORY',
+    )
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # El driver no abre transacciones por su cuenta: las abre el evento begin
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(conn):
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if is_write_request() else 'BEGIN')
+
+
+def retry_locked(dispatch, retries):
+    def dispatch_request(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return dispatch(*args, **kwargs)
+            except OperationalError as error:
+                if attempt >= retries or not is_write_request() or not is_locked_error(error):
+                    raise
+                db.session.rollback()
+                attempt += 1
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+    return dispatch_request
+
+
+def init_sqlite(app):
+    """Tune every SQLite engine; call it after ``db.init_app``."""
+    if not app.config['SQLITE_TUNED']:
+        return
+    with app.app_context():
+        engines = [engine for engine in db.engines.values() if engine.dialect.name == 'sqlite']
+    if not engines:
+        return
+    for engine in engines:
+        tune_engine(engine, app.config)
+
+    app.dispatch_request = retry_locked(app.dispatch_request, app.config['SQLITE_WRITE_RETRIES'])
+
+    @app.before_request
+    def acquire_writer():
+        if is_write_request():
+            # Las escrituras de este proceso esperan aquí en vez de en el busy handler de SQLite
+            _write_lock.acquire()
+            g.sqlite_writer = True
+
+    @app.teardown_request
+    def release_writer(exc):
+        if g.pop('sqlite_writer', False):
+            _write_lock.release()
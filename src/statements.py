@@ -0,0 +1,50 @@
+"""
+Prebuilt statements for the hot request paths
+
+Each statement is built once at import with ``bindparam`` placeholders. The
+cache key is memoized on the statement object and the compiled SQL lives in
+the engine's compiled cache, so executing one skips both building the query
+and compiling it; only the parameters change between requests.
+"""
+from sqlalchemy import bindparam, select
+from models import db, User, Favourite, CATALOG_MODELS
+
+USER_BY_CREDENTIALS = (
+    select(User)
+    .where(User.name == bindparam('name'), User.password == bindparam('password'))
+    .limit(1)
+)
+
+USER_FAVOURITES = (
+    select(Favourite)
+    .where(Favourite.id_user == bindparam('id_user'))
+    .order_by(Favourite.id_favourite)
+)
+
+# Búsqueda por clave primaria: 'user' y cada tipo de CATALOG_MODELS
+BY_ID = {'user': select(User).where(User.id_user == bindparam('id'))}
+BY_ID.update({entity_type: select(model).where(model.id == bindparam('id'))
+              for entity_type, model in CATALOG_MODELS.items()})
+
+# Lecturas por lote: un único IN con la lista expandida al ejecutar
+BY_IDS = {'user': select(User).where(User.id_user.in_(bindparam('ids', expanding=True)))}
+BY_IDS.update({entity_type: select(model).where(model.id.in_(bindparam('ids', expanding=True)))
+               for entity_type, model in CATALOG_MODELS.items()})
+
+
+def first(statement, **params):
+    return db.session.execute(statement, params).scalars().first()
+
+
+def all_rows(statement, **params):
+    return db.session.execute(statement, params).scalars().all()
+
+
+def by_id(entity_type, id_):
+    return first(BY_ID[entity_type], id=id_)
+
+
+def by_ids(entity_type, ids):
+    """{id: serialized row} for the ids that exist, in one query."""
+    objects = all_rows(BY_IDS[entity_type], ids=list(ids)) if ids else []
+    return {item["id"]: item for item in (obj.serialize() for obj in objects)}
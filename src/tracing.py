@@ -0,0 +1,296 @@
+"""
+Lightweight request tracing: routing, auth, SQL, serialize() and jsonify spans
+
+Context is propagated with the W3C ``traceparent`` header. When TRACING_ENABLED
+is off no hooks are installed and ``span()`` returns a shared no-op object.
+"""
+import importlib
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import jwt_required as _jwt_required, verify_jwt_in_request
+from metrics import on_statement
+from profiler import require_token
+
+ENABLED = False
+exporter = None
+_CURRENT = object()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP = _NoopSpan()
+
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+def _now_ns():
+    return time.time_ns()
+
+
+class Trace:
+    def __init__(self, trace_id, parent_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.stack = [parent_id] if parent_id else []
+        self.serialize_calls = 0
+        self.serialize_ns = 0
+        self.serialize_start = None
+
+    def add(self, name, start_ns, end_ns, span_id=None, parent_id=_CURRENT, **attributes):
+        if parent_id is _CURRENT:
+            parent_id = self.stack[-1] if self.stack else None
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": span_id or _new_id(8),
+            "parent_id": parent_id,
+            "name": name,
+            "start_ns": start_ns,
+            "end_ns": end_ns,
+            "attributes": attributes,
+        }
+        self.spans.append(span)
+        return span
+
+
+class Span:
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.span_id = _new_id(8)
+
+    def __enter__(self):
+        self.parent_id = self.trace.stack[-1] if self.trace.stack else None
+        self.trace.stack.append(self.span_id)
+        self.start = _now_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.stack.pop()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.trace.add(self.name, self.start, _now_ns(), self.span_id, self.parent_id, **self.attributes)
+        return False
+
+
+def span(name, **attributes):
+    if not ENABLED:
+        return NOOP
+    trace = g.get('trace')
+    if trace is None:
+        return NOOP
+    return Span(trace, name, attributes)
+
+
+def parse_traceparent(value):
+    parts = (value or '').split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+def jwt_required(*args, **kwargs):
+    """Drop-in for flask_jwt_extended.jwt_required that records the token check as an auth span."""
+    if not ENABLED:
+        return _jwt_required(*args, **kwargs)
+
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*fn_args, **fn_kwargs):
+            with span('auth'):
+                verify_jwt_in_request(*args, **kwargs)
+            return current_app.ensure_sync(fn)(*fn_args, **fn_kwargs)
+        return decorator
+    return wrapper
+
+
+def traced_serialize(serialize):
+    # Un solo span agregado por petición en lugar de uno por fila
+    @wraps(serialize)
+    def wrapper(self):
+        trace = g.get('trace')
+        if trace is None:
+            return serialize(self)
+        start = _now_ns()
+        if trace.serialize_start is None:
+            trace.serialize_start = start
+        try:
+            return serialize(self)
+        finally:
+            trace.serialize_calls += 1
+            trace.serialize_ns += _now_ns() - start
+    return wrapper
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with span('jsonify'):
+            return super().response(*args, **kwargs)
+
+
+class RingBufferExporter:
+    def __init__(self, app):
+        self.traces = deque(maxlen=app.config['TRACING_RING_SIZE'])
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+class FileExporter:
+    def __init__(self, app):
+        self.path = app.config['TRACING_FILE']
+        self.lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace) + '\n'
+        with self.lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+class OTLPExporter:
+    """OTLP/HTTP JSON exporter, sent in batches from a background thread."""
+
+    def __init__(self, app):
+        self.endpoint = app.config['TRACING_OTLP_ENDPOINT']
+        self.service = app.config['TRACING_SERVICE_NAME']
+        self.queue = queue.Queue(maxsize=1000)
+        self.dropped = 0
+        threading.Thread(target=self.run, name='otlp-exporter', daemon=True).start()
+
+    def export(self, trace):
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 100 and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            spans = [self.to_otlp(span) for trace in batch for span in trace["spans"]]
+            body = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+                "scopeSpans": [{"scope": {"name": "sw-api"}, "spans": spans}],
+            }]}
+            req = urllib.request.Request(self.endpoint, data=json.dumps(body).encode(),
+                                         headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(req, timeout=5).close()
+            except Exception:
+                self.dropped += len(batch)
+
+    @staticmethod
+    def to_otlp(span):
+        return {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "parentSpanId": span["parent_id"] or "",
+            "name": span["name"],
+            "kind": 2 if span["name"] == "request" else 1,
+            "startTimeUnixNano": str(span["start_ns"]),
+            "endTimeUnixNano": str(span["end_ns"]),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}}
+                           for key, value in span["attributes"].items()],
+        }
+
+
+EXPORTERS = {
+    'ring': RingBufferExporter,
+    'file': FileExporter,
+    'otlp': OTLPExporter,
+}
+
+
+def load_exporter(app):
+    name = app.config['TRACING_EXPORTER']
+    if name in EXPORTERS:
+        return EXPORTERS[name](app)
+    # Exportador propio: "paquete.modulo:Clase", construido con la app
+    module, _, attr = name.partition(':')
+    return getattr(importlib.import_module(module), attr)(app)
+
+
+def start_trace():
+    trace_id, parent_id = parse_traceparent(request.headers.get('traceparent'))
+    trace = Trace(trace_id or _new_id(16), parent_id)
+    g.trace = trace
+    g.trace_parent_id = parent_id
+    g.trace_root_id = _new_id(8)
+    g.trace_root_start = request.environ.get('tracing.start_ns', _now_ns())
+    trace.stack.append(g.trace_root_id)
+    # Desde que entra la petición WSGI hasta aquí: url matching y contexto
+    trace.add('routing', g.trace_root_start, _now_ns(), endpoint=request.endpoint)
+
+
+def finish_trace(response):
+    trace = g.get('trace')
+    if trace is None:
+        return response
+    root_id = g.trace_root_id
+    if trace.serialize_calls:
+        trace.add('serialize', trace.serialize_start, trace.serialize_start + trace.serialize_ns,
+                  parent_id=root_id, calls=trace.serialize_calls)
+    trace.add('request', g.trace_root_start, _now_ns(), root_id, g.trace_parent_id,
+              method=request.method, route=request.url_rule.rule if request.url_rule else request.path,
+              status=response.status_code)
+    response.headers['traceparent'] = f'00-{trace.trace_id}-{root_id}-01'
+    exporter.export({"trace_id": trace.trace_id, "spans": trace.spans})
+    g.trace = None
+    return response
+
+
+def record_sql(statement, parameters, start, elapsed):
+    trace = g.get('trace')
+    if trace is None:
+        return
+    end_ns = _now_ns()
+    trace.add('sql', end_ns - int(elapsed * 1e9), end_ns, statement=statement[:500])
+
+
+def init_tracing(app, models):
+    global ENABLED, exporter
+    if not app.config['TRACING_ENABLED']:
+        return
+    ENABLED = True
+    exporter = load_exporter(app)
+
+    wsgi_app = app.wsgi_app
+
+    def timed_wsgi_app(environ, start_response):
+        environ['tracing.start_ns'] = _now_ns()
+        return wsgi_app(environ, start_response)
+
+    app.wsgi_app = timed_wsgi_app
+    app.json = TracedJSONProvider(app)
+    for model in models:
+        model.serialize = traced_serialize(model.serialize)
+    on_statement(record_sql)
+    # El primero en before_request y el último en after_request
+    app.before_request_funcs.setdefault(None, []).insert(0, start_trace)
+    app.after_request(finish_trace)
+
+    if isinstance(exporter, RingBufferExporter):
+        @app.route('/traces', methods=['GET'])
+        def list_traces():
+            require_token()
+            limit = request.args.get('limit', 50, type=int)
+            return jsonify(list(exporter.traces)[-limit:]), 200
@@ -0,0 +1,106 @@
+"""
+Single-statement inserts and upserts keyed by each catalog model's natural key
+
+``INSERT ... ON CONFLICT`` on the unique name/title index replaces the
+SELECT-then-INSERT duplicate checks: one round trip, and two concurrent
+requests for the same name can no longer both insert. MySQL uses
+``ON DUPLICATE KEY UPDATE``; any other dialect falls back to an INSERT inside
+a savepoint, taking an IntegrityError as the conflict.
+"""
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, Film
+import changes
+
+# Clave natural de cada modelo: la columna con índice único
+NATURAL_KEYS = {Film: 'title'}
+
+# Dialectos con INSERT ... ON CONFLICT ... RETURNING
+ON_CONFLICT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def natural_key(model):
+    return NATURAL_KEYS.get(model, 'name')
+
+
+def dialect_name():
+    return db.session.get_bind().dialect.name
+
+
+def dialect_insert(model):
+    """The dialect's INSERT with ON CONFLICT, or None when it has none."""
+    insert_ = ON_CONFLICT_INSERTS.get(dialect_name())
+    return insert_(model) if insert_ else None
+
+
+def insert_in_savepoint(model, values):
+    """Plain INSERT that returns the new primary key, or None on an IntegrityError."""
+    try:
+        with db.session.begin_nested():
+            return db.session.execute(insert(model).values(**values)).inserted_primary_key[0]
+    except IntegrityError:
+        return None
+
+
+def insert_if_absent(model, values, conflict_columns=None):
+    """Insert a row unless it conflicts on ``conflict_columns``; return its id or None."""
+    columns = conflict_columns or [natural_key(model)]
+    stmt = dialect_insert(model)
+    if stmt is None:
+        new_id = insert_in_savepoint(model, values)
+    else:
+        primary_key = model.__mapper__.primary_key[0]
+        new_id = db.session.execute(
+            stmt.values(**values).on_conflict_do_nothing(index_elements=columns).returning(primary_key)
+        ).scalar()
+    if new_id is not None and model.__tablename__ in changes.TYPE_BY_TABLE:
+        changes.record(changes.TYPE_BY_TABLE[model.__tablename__], [new_id])
+    return new_id
+
+
+def upsert(model, key, values):
+    """Insert or update the row whose natural key is ``key``; return (row, created)."""
+    key_column = natural_key(model)
+    key_attribute = getattr(model, key_column)
+    # version siempre sube al actualizar: una fila con version 1 es una fila recién creada
+    changed = {**values, 'version': model.version + 1}
+    stmt = dialect_insert(model)
+    if stmt is not None:
+        stmt = stmt.values(**values, **{key_column: key}).on_conflict_do_update(
+            index_elements=[key_column], set_=changed,
+        ).returning(*model.__table__.columns)
+        row = db.session.execute(stmt).one()
+    else:
+        if dialect_name() == 'mysql':
+            db.session.execute(
+                mysql.insert(model).values(**values, **{key_column: key}).on_duplicate_key_update(**changed))
+        elif insert_in_savepoint(model, {**values, key_column: key}) is None:
+            db.session.execute(update(model).where(key_attribute == key).values(**changed))
+        # Sin RETURNING: la fila se relee por su clave natural
+        row = db.session.execute(select(*model.__table__.columns).where(key_attribute == key)).one()
+    changes.record(model.__tablename__, [row.id])
+    return row, row.version == 1
+
+
+def add_to_counter(model, keys, column, delta):
+    """Add ``delta`` to ``column`` of the row with primary key ``keys``, creating it if missing."""
+    counter = getattr(model, column)
+    stmt = dialect_insert(model)
+    if stmt is not None:
+        db.session.execute(stmt.values(**keys, **{column: delta}).on_conflict_do_update(
+            index_elements=list(keys), set_={column: counter + delta}))
+    elif dialect_name() == 'mysql':
+        db.session.execute(mysql.insert(model).values(**keys, **{column: delta})
+                           .on_duplicate_key_update(**{column: counter + delta}))
+    else:
+        where = [getattr(model, name) == value for name, value in keys.items()]
+        # Si otra petición crea la fila entre el UPDATE y el INSERT, se repite el UPDATE
+        for _ in range(2):
+            result = db.session.execute(update(model).where(*where).values(**{column: counter + delta})
+                                        .execution_options(synchronize_session=False))
+            if result.rowcount or insert_in_savepoint(model, {**keys, column: delta}) is not None:
+                return
@@ -12,9 +12,31 @@ class APIException(Exception):
 
     def to_dict(self):
         rv = dict(self.payload or ())
-        rv['message'] = self.message
+        rv['msg'] = self.message
         return rv
 
+def parse_ids(raw, max_size):
+    """Parse a comma separated list of ids like ``1,2,3`` keeping the request order, without repeats."""
+    if not raw:
+        raise APIException("Missing ids", status_code=400)
+    values = [value.strip() for value in raw.split(',')]
+    values = [value for value in values if value]
+    # Antes de convertir y deduplicar: una lista enorme se rechaza sin más trabajo
+    check_batch_size(values, max_size)
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except ValueError:
+            raise APIException(f"Invalid id {value}", status_code=400)
+    if not ids:
+        raise APIException("Missing ids", status_code=400)
+    return list(dict.fromkeys(ids))
+
+def check_batch_size(items, max_size):
+    if len(items) > max_size:
+        raise APIException(f"Batch too large, max {max_size} items", status_code=413)
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
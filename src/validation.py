@@ -0,0 +1,136 @@
+"""
+Request payload validation compiled once per model from its columns
+
+Every error in the payload is collected and reported in a single 400, before
+the request touches the database. Bulk routes call ``check`` per item to get
+the errors without raising. A ``nullable=False`` column without a default is
+required on create and never accepts null.
+"""
+from sqlalchemy import Boolean, Float, Integer, Numeric, String
+from utils import APIException
+
+# Columnas que gestiona el servidor y nunca se aceptan del cliente
+SERVER_FIELDS = ('id', 'version')
+
+
+def to_int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    raise ValueError
+
+
+def to_float(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return float(value.strip())
+    raise ValueError
+
+
+def to_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    raise ValueError
+
+
+COERCERS = (
+    (Boolean, to_bool, 'a boolean'),
+    (Integer, to_int, 'an integer'),
+    (Numeric, to_float, 'a number'),
+    (Float, to_float, 'a number'),
+    (String, to_str, 'a string'),
+)
+
+
+def compile_field(column):
+    for column_type, coerce, expected in COERCERS:
+        if isinstance(column.type, column_type):
+            break
+    else:
+        coerce, expected = (lambda value: value), None
+    length = getattr(column.type, 'length', None)
+    return column.name, coerce, expected, column.nullable, length
+
+
+class Validator:
+    def __init__(self, model):
+        self.model = model
+        self.fields = {name: (coerce, expected, nullable, length)
+                       for name, coerce, expected, nullable, length in map(compile_field, model.__table__.columns)
+                       if name not in SERVER_FIELDS}
+        self.required = tuple(column.name for column in model.__table__.columns
+                              if column.name in self.fields and not column.nullable
+                              and column.default is None and column.server_default is None)
+
+    def check(self, data, partial=False):
+        """Return (coerced values, errors by field) without raising."""
+        if not isinstance(data, dict):
+            return {}, {"_": "Expected an object"}
+        values = {}
+        errors = {}
+        for key, value in data.items():
+            if key in SERVER_FIELDS:
+                continue
+            field = self.fields.get(key)
+            if field is None:
+                errors[key] = "Unknown field"
+                continue
+            coerce, expected, nullable, length = field
+            if value is None:
+                if not nullable:
+                    errors[key] = "Must not be null"
+                else:
+                    values[key] = None
+                continue
+            try:
+                value = coerce(value)
+            except (TypeError, ValueError):
+                errors[key] = f"Must be {expected}"
+                continue
+            if length is not None and len(value) > length:
+                errors[key] = f"Must be at most {length} characters"
+                continue
+            values[key] = value
+        if not partial:
+            for key in self.required:
+                if key not in data:
+                    errors[key] = "Missing field"
+        return values, errors
+
+    def __call__(self, data, partial=False):
+        values, errors = self.check(data, partial)
+        if errors:
+            raise APIException("Invalid payload", status_code=400, payload={"errors": errors})
+        if partial and not values:
+            raise APIException("Missing fields", status_code=400)
+        return values
+
+
+_validators = {}
+
+
+def validator_for(model):
+    validator = _validators.get(model)
+    if validator is None:
+        validator = _validators[model] = Validator(model)
+    return validator
+
+
+def validate(model, data, partial=False):
+    return validator_for(model)(data, partial)